@@ -1,10 +1,11 @@
 import csv
 import io
 from dataclasses import dataclass, field
-from typing import Optional
+from itertools import chain
+from typing import Iterable, Optional, Union
 
 
-@dataclass
+@dataclass(slots=True)
 class Beneficiary:
     """Represents a single beneficiary record for routing."""
     row_number: int
@@ -58,6 +59,21 @@ class ParseResult:
 REQUIRED_COLUMNS = ['name', 'address']
 OPTIONAL_COLUMNS = ['phone', 'household_size', 'items_needed', 'special_items', 'notes']
 
+# Order in which row fields are read by parse_csv
+FIELD_COLUMNS = ('name', 'phone', 'address', 'household_size', 'items_needed', 'special_items', 'notes')
+
+
+# Accepted header spellings per column, in order of preference
+_COLUMN_ALIASES = {
+    'name': ('name', 'full_name', 'beneficiary_name', 'recipient'),
+    'address': ('address', 'street_address', 'full_address', 'location', 'delivery_address'),
+    'phone': ('phone', 'phone_number', 'telephone', 'tel', 'mobile'),
+    'household_size': ('household_size', 'family_size', 'num_people', 'people'),
+    'items_needed': ('items_needed', 'items', 'needs', 'requested_items'),
+    'special_items': ('special_items', 'special_needs', 'extras', 'additional_items'),
+    'notes': ('notes', 'comments', 'remarks', 'additional_notes'),
+}
+
 
 def normalize_header(header: str) -> str:
     """Normalize column header for matching."""
@@ -75,50 +91,25 @@ def find_column_mapping(headers: list) -> tuple[dict, list]:
     normalized_headers = {normalize_header(h): i for i, h in enumerate(headers)}
 
     missing = []
-    for col in REQUIRED_COLUMNS:
-        if col in normalized_headers:
-            mapping[col] = normalized_headers[col]
+    for col, aliases in _COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized_headers:
+                mapping[col] = normalized_headers[alias]
+                break
         else:
-            # Try common variations
-            variations = {
-                'name': ['full_name', 'beneficiary_name', 'recipient'],
-                'address': ['street_address', 'full_address', 'location', 'delivery_address']
-            }
-            found = False
-            for var in variations.get(col, []):
-                if var in normalized_headers:
-                    mapping[col] = normalized_headers[var]
-                    found = True
-                    break
-            if not found:
+            if col in REQUIRED_COLUMNS:
                 missing.append(col)
 
-    # Map optional columns
-    for col in OPTIONAL_COLUMNS:
-        if col in normalized_headers:
-            mapping[col] = normalized_headers[col]
-        else:
-            variations = {
-                'phone': ['phone_number', 'telephone', 'tel', 'mobile'],
-                'household_size': ['family_size', 'num_people', 'people'],
-                'items_needed': ['items', 'needs', 'requested_items'],
-                'special_items': ['special_needs', 'extras', 'additional_items'],
-                'notes': ['comments', 'remarks', 'additional_notes']
-            }
-            for var in variations.get(col, []):
-                if var in normalized_headers:
-                    mapping[col] = normalized_headers[var]
-                    break
-
     return mapping, missing
 
 
-def parse_csv(file_content: str) -> ParseResult:
+def parse_csv(file_content: Union[str, Iterable[str]]) -> ParseResult:
     """
     Parse CSV content and extract beneficiary records.
 
     Args:
-        file_content: Raw CSV file content as string
+        file_content: Raw CSV file content as string, or a text stream
+            (opened with newline='') that is read row by row
 
     Returns:
         ParseResult with beneficiaries and any errors/warnings
@@ -127,43 +118,44 @@ def parse_csv(file_content: str) -> ParseResult:
     errors = []
     warnings = []
 
+    if isinstance(file_content, str):
+        file_content = io.StringIO(file_content)
+
     try:
-        reader = csv.reader(io.StringIO(file_content))
-        rows = list(reader)
+        return _parse_rows(csv.reader(file_content), beneficiaries, errors, warnings)
     except csv.Error as e:
         errors.append(f"CSV parsing error: {str(e)}")
-        return ParseResult(beneficiaries, errors, warnings)
+        return ParseResult([], errors, warnings)
 
-    if len(rows) < 2:
+
+def _parse_rows(reader, beneficiaries: list, errors: list, warnings: list) -> ParseResult:
+    """Build beneficiaries from CSV rows as the reader produces them."""
+    headers = next(reader, None)
+    first_row = next(reader, None)
+    if headers is None or first_row is None:
         errors.append("CSV file must contain a header row and at least one data row")
         return ParseResult(beneficiaries, errors, warnings)
 
-    headers = rows[0]
     mapping, missing = find_column_mapping(headers)
 
     if missing:
         errors.append(f"Missing required columns: {', '.join(missing)}")
         return ParseResult(beneficiaries, errors, warnings)
 
-    for row_num, row in enumerate(rows[1:], start=2):
-        if not any(cell.strip() for cell in row):
+    # Column positions resolved once, -1 where the file lacks the column
+    columns = tuple(mapping.get(col, -1) for col in FIELD_COLUMNS)
+
+    for row_num, row in enumerate(chain((first_row,), reader), start=2):
+        if not any(cell and not cell.isspace() for cell in row):
             continue  # Skip empty rows
 
         row_errors = []
         row_warnings = []
 
-        def get_value(col: str) -> str:
-            if col in mapping and mapping[col] < len(row):
-                return row[mapping[col]].strip()
-            return ''
-
-        name = get_value('name')
-        phone = get_value('phone')
-        address = get_value('address')
-        household_size = get_value('household_size')
-        items_needed = get_value('items_needed')
-        special_items = get_value('special_items')
-        notes = get_value('notes')
+        row_len = len(row)
+        name, phone, address, household_size, items_needed, special_items, notes = [
+            row[i].strip() if 0 <= i < row_len else '' for i in columns
+        ]
 
         # Validate required fields
         if not name:
@@ -0,0 +1,38 @@
+from math import radians, sin, cos, sqrt, asin
+import numpy as np
+
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Calculate approximate distance between two points in kilometers.
+    Uses Haversine formula.
+    """
+    R = 6371  # Earth's radius in kilometers
+
+    lat1 = radians(lat1)
+    lat2 = radians(lat2)
+    sin_dlat = sin((lat2 - lat1) / 2)
+    sin_dlon = sin(radians(lon2 - lon1) / 2)
+
+    a = sin_dlat * sin_dlat + cos(lat1) * cos(lat2) * sin_dlon * sin_dlon
+
+    return 2 * R * asin(sqrt(min(a, 1.0)))
+
+
+def calculate_distances(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Calculate approximate distances from one point to many points in kilometers.
+    Vectorized Haversine formula, same as calculate_distance.
+    """
+    R = 6371  # Earth's radius in kilometers
+
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+
+    dlat = lats - lat
+    dlon = lons - lon
+
+    a = np.sin(dlat/2)**2 + np.cos(lat) * np.cos(lats) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+    return R * c
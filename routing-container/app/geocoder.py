@@ -1,13 +1,70 @@
+import os
+import threading
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
 from typing import Optional, Tuple
+from geopy.adapters import RequestsAdapter
 from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError, GeocoderUnavailable
-
-
-# Rate limiting for Nominatim (1 request per second)
-_last_request_time = 0
-_MIN_REQUEST_INTERVAL = 1.1  # seconds
+from geopy.exc import GeocoderTimedOut, GeocoderServiceError, GeocoderUnavailable, GeocoderRateLimited
+
+
+# Nominatim server (a self-hosted instance can be used instead of the public one)
+_NOMINATIM_DOMAIN = os.environ.get('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')
+_NOMINATIM_SCHEME = os.environ.get('NOMINATIM_SCHEME', 'https')
+
+# Rate limiting for Nominatim (1 request per second on the public server)
+# Threads reserve the next free request slot under the lock, then wait outside it
+_next_request_time = 0.0
+_rate_limit_lock = threading.Lock()
+_MIN_REQUEST_INTERVAL = float(os.environ.get('NOMINATIM_MIN_INTERVAL', 1.1))  # seconds
+
+# Concurrent geocoding workers (requests are still spaced by _rate_limit)
+_MAX_WORKERS = max(1, int(os.environ.get('GEOCODER_MAX_WORKERS', 4)))
+
+
+# Common street type abbreviations
+_ABBREVIATIONS = {
+    'st': 'Street',
+    'ave': 'Avenue',
+    'blvd': 'Boulevard',
+    'dr': 'Drive',
+    'ln': 'Lane',
+    'rd': 'Road',
+    'ct': 'Court',
+    'pl': 'Place',
+    'pkwy': 'Parkway',
+    'hwy': 'Highway',
+    'cir': 'Circle',
+    'trl': 'Trail',
+    'ter': 'Terrace',
+    'way': 'Way',
+}
+
+# Direction abbreviations
+_DIRECTIONS = {
+    'n': 'North',
+    's': 'South',
+    'e': 'East',
+    'w': 'West',
+    'ne': 'Northeast',
+    'nw': 'Northwest',
+    'se': 'Southeast',
+    'sw': 'Southwest',
+}
+
+# All expansions matched in a single pass (longest alternatives first),
+# with an optional trailing period consumed along with the abbreviation
+_EXPANSIONS = {**_ABBREVIATIONS, **_DIRECTIONS}
+_EXPANSION_RE = re.compile(
+    r'\b(' + '|'.join(sorted(_EXPANSIONS, key=len, reverse=True)) + r')\b\.?',
+    re.IGNORECASE
+)
+
+# Suite/unit/apt designators and ZIP codes, stripped when building variations
+_SUITE_RE = re.compile(r',?\s*(Suite|Ste|Unit|Apt|#)\s*[\w-]+', re.IGNORECASE)
+_ZIP_RE = re.compile(r'\b\d{5}(-\d{4})?\b')
 
 
 def normalize_address(address: str) -> str:
@@ -20,42 +77,8 @@ def normalize_address(address: str) -> str:
 
     addr = address.strip()
 
-    # Common street type abbreviations
-    abbreviations = {
-        r'\bSt\b\.?': 'Street',
-        r'\bAve\b\.?': 'Avenue',
-        r'\bBlvd\b\.?': 'Boulevard',
-        r'\bDr\b\.?': 'Drive',
-        r'\bLn\b\.?': 'Lane',
-        r'\bRd\b\.?': 'Road',
-        r'\bCt\b\.?': 'Court',
-        r'\bPl\b\.?': 'Place',
-        r'\bPkwy\b\.?': 'Parkway',
-        r'\bHwy\b\.?': 'Highway',
-        r'\bCir\b\.?': 'Circle',
-        r'\bTrl\b\.?': 'Trail',
-        r'\bTer\b\.?': 'Terrace',
-        r'\bWay\b\.?': 'Way',
-    }
-
-    # Direction abbreviations
-    directions = {
-        r'\bN\b\.?': 'North',
-        r'\bS\b\.?': 'South',
-        r'\bE\b\.?': 'East',
-        r'\bW\b\.?': 'West',
-        r'\bNE\b\.?': 'Northeast',
-        r'\bNW\b\.?': 'Northwest',
-        r'\bSE\b\.?': 'Southeast',
-        r'\bSW\b\.?': 'Southwest',
-    }
-
-    # Apply abbreviation expansions
-    for pattern, replacement in abbreviations.items():
-        addr = re.sub(pattern, replacement, addr, flags=re.IGNORECASE)
-
-    for pattern, replacement in directions.items():
-        addr = re.sub(pattern, replacement, addr, flags=re.IGNORECASE)
+    # Expand street type and direction abbreviations
+    addr = _EXPANSION_RE.sub(lambda m: _EXPANSIONS[m.group(1).lower()], addr)
 
     # Remove extra whitespace
     addr = ' '.join(addr.split())
@@ -67,75 +90,107 @@ def create_address_variations(address: str) -> list:
     """
     Create variations of an address to try if the original fails.
     """
-    variations = []
-
     if not address:
         return [address]
 
+    # Ordered list to try, plus a set for constant-time duplicate checks
+    variations = []
+    seen = set()
+
+    def add(variation: str):
+        if variation not in seen:
+            seen.add(variation)
+            variations.append(variation)
+
     # Variation 1: Original address
-    variations.append(address)
+    add(address)
 
     # Variation 2: Remove suite/unit/apt numbers
-    no_suite = re.sub(r',?\s*(Suite|Ste|Unit|Apt|#)\s*[\w-]+', '', address, flags=re.IGNORECASE)
+    no_suite = _SUITE_RE.sub('', address)
     no_suite = ' '.join(no_suite.split())  # Clean up whitespace
-    if no_suite != address and no_suite not in variations:
-        variations.append(no_suite)
+    add(no_suite)
 
     # Variation 3: Normalized version (expand abbreviations)
-    normalized = normalize_address(address)
-    if normalized not in variations:
-        variations.append(normalized)
+    add(normalize_address(address))
 
     # Variation 4: Normalized without suite
-    normalized_no_suite = normalize_address(no_suite)
-    if normalized_no_suite not in variations:
-        variations.append(normalized_no_suite)
+    add(normalize_address(no_suite))
 
     # Variation 5: Add USA suffix
-    with_usa = address + ", USA"
-    if with_usa not in variations:
-        variations.append(with_usa)
+    add(address + ", USA")
 
     # Variation 6: No suite with USA
-    no_suite_usa = no_suite + ", USA"
-    if no_suite_usa not in variations:
-        variations.append(no_suite_usa)
+    add(no_suite + ", USA")
 
     # Variation 7: Just city and state with street number and name
     # Try to extract core address without zip
-    no_zip = re.sub(r'\b\d{5}(-\d{4})?\b', '', no_suite)
+    no_zip = _ZIP_RE.sub('', no_suite)
     no_zip = no_zip.strip().rstrip(',').strip()
-    if no_zip not in variations:
-        variations.append(no_zip)
+    add(no_zip)
 
     return variations
 
 
 def _rate_limit():
     """Ensure we don't exceed Nominatim rate limits."""
-    global _last_request_time
-    now = time.time()
-    elapsed = now - _last_request_time
-    if elapsed < _MIN_REQUEST_INTERVAL:
-        time.sleep(_MIN_REQUEST_INTERVAL - elapsed)
-    _last_request_time = time.time()
+    global _next_request_time
+    with _rate_limit_lock:
+        now = time.monotonic()
+        slot = max(now, _next_request_time)
+        _next_request_time = slot + _MIN_REQUEST_INTERVAL
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _back_off(delay: float):
+    """Hold back every worker's next request after the server asked us to slow down."""
+    global _next_request_time
+    with _rate_limit_lock:
+        _next_request_time = max(_next_request_time, time.monotonic() + delay)
 
 
 # Initialize geocoder with proper user agent
 _geocoder = None
+_geocoder_lock = threading.Lock()
 
 
 def get_geocoder() -> Nominatim:
-    """Get or create the geocoder instance."""
+    """
+    Get or create the geocoder instance.
+    The instance is shared across requests so its requests.Session keeps
+    connections to Nominatim alive instead of re-doing TCP/TLS handshakes.
+    """
     global _geocoder
-    if _geocoder is None:
-        _geocoder = Nominatim(
-            user_agent="humanitarian-aid-delivery-router/1.0",
-            timeout=10
-        )
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Nominatim(
+                user_agent="humanitarian-aid-delivery-router/1.0",
+                timeout=10,
+                domain=_NOMINATIM_DOMAIN,
+                scheme=_NOMINATIM_SCHEME,
+                # One pooled connection per geocoding worker
+                adapter_factory=partial(RequestsAdapter, pool_maxsize=_MAX_WORKERS)
+            )
     return _geocoder
 
 
+@lru_cache(maxsize=50000)
+def _cached_geocode(query: str) -> Optional[Tuple[float, float]]:
+    """
+    Geocode a single query string, remembering results for the life of the process.
+    Re-running the same CSV skips Nominatim (and its rate limit) entirely.
+
+    Returns:
+        (latitude, longitude), or None if Nominatim found no match.
+        Errors are raised and therefore never cached.
+    """
+    _rate_limit()
+    location = get_geocoder().geocode(query, exactly_one=True, addressdetails=True)
+    if location:
+        return location.latitude, location.longitude
+    return None
+
+
 def geocode_address(address: str, max_retries: int = 3) -> Tuple[Optional[float], Optional[float], str]:
     """
     Geocode an address to latitude/longitude coordinates.
@@ -153,8 +208,6 @@ def geocode_address(address: str, max_retries: int = 3) -> Tuple[Optional[float]
     if not address or not address.strip():
         return None, None, "Empty address"
 
-    geocoder = get_geocoder()
-
     # Generate address variations to try
     variations = create_address_variations(address.strip())
     last_error = "Address not found"
@@ -165,11 +218,11 @@ def geocode_address(address: str, max_retries: int = 3) -> Tuple[Optional[float]
 
         for attempt in range(max_retries):
             try:
-                _rate_limit()
-                location = geocoder.geocode(addr_variation, exactly_one=True, addressdetails=True)
+                # Collapse whitespace so trivially different inputs share a cache entry
+                coords = _cached_geocode(' '.join(addr_variation.split()))
 
-                if location:
-                    return location.latitude, location.longitude, ""
+                if coords:
+                    return coords[0], coords[1], ""
                 else:
                     # This variation didn't work, try next
                     break
@@ -181,6 +234,15 @@ def geocode_address(address: str, max_retries: int = 3) -> Tuple[Optional[float]
                 last_error = "Geocoding timed out"
                 break
 
+            except GeocoderRateLimited as e:
+                # HTTP 429 - wait as long as the server asks (or back off
+                # exponentially), then retry through _rate_limit
+                if attempt < max_retries - 1:
+                    _back_off(e.retry_after or 2 ** (attempt + 1))
+                    continue
+                last_error = "Geocoding rate limited"
+                break
+
             except GeocoderUnavailable:
                 if attempt < max_retries - 1:
                     time.sleep(2 ** attempt)
@@ -210,24 +272,39 @@ def geocode_beneficiaries(beneficiaries: list, progress_callback=None) -> list:
     Returns:
         Updated list of beneficiaries with geocoding results
     """
-    total = len(beneficiaries)
+    pending = [b for b in beneficiaries if not b.excluded and b.is_valid()]
+    total = len(pending)
 
-    for i, beneficiary in enumerate(beneficiaries):
-        if beneficiary.excluded or not beneficiary.is_valid():
-            continue
+    # Group beneficiaries sharing an address so each address is geocoded once
+    by_address = {}
+    for b in pending:
+        by_address.setdefault(normalize_address(b.address).lower(), []).append(b)
+
+    done = 0
+
+    # Geocode in parallel - workers overlap network latency while
+    # _rate_limit keeps requests spaced for the Nominatim server
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(geocode_address, group[0].address): group
+            for group in by_address.values()
+        }
 
-        lat, lon, error = geocode_address(beneficiary.address)
+        for future in as_completed(futures):
+            lat, lon, error = future.result()
 
-        beneficiary.latitude = lat
-        beneficiary.longitude = lon
-        beneficiary.geocode_error = error
+            for beneficiary in futures[future]:
+                beneficiary.latitude = lat
+                beneficiary.longitude = lon
+                beneficiary.geocode_error = error
 
-        if error:
-            beneficiary.warnings.append(f"Geocoding: {error}")
-            beneficiary.flagged = True
+                if error:
+                    beneficiary.warnings.append(f"Geocoding: {error}")
+                    beneficiary.flagged = True
 
-        if progress_callback:
-            progress_callback(i + 1, total)
+                done += 1
+                if progress_callback:
+                    progress_callback(done, total)
 
     return beneficiaries
 
@@ -272,22 +349,3 @@ def export_failed_geocodes(beneficiaries: list) -> str:
 
     return output.getvalue()
 
-
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """
-    Calculate approximate distance between two points in kilometers.
-    Uses Haversine formula.
-    """
-    from math import radians, sin, cos, sqrt, atan2
-
-    R = 6371  # Earth's radius in kilometers
-
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-
-    return R * c
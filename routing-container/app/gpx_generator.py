@@ -1,51 +1,97 @@
-import gpxpy
-import gpxpy.gpx
+import re
 from typing import List
+from operator import attrgetter
 from datetime import datetime
+from xml.sax.saxutils import escape
+
+# GPX 1.1 fragments, written directly instead of building a gpxpy object graph
+_GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx xmlns="http://www.topografix.com/GPX/1/1" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd" '
+    'version="1.1" creator="Humanitarian Aid Delivery Router">\n'
+)
+_METADATA_TMPL = '  <metadata>\n    <name>{}</name>\n    <desc>{}</desc>\n    <time>{}</time>\n  </metadata>\n'
+_WPT_TMPL = '  <wpt lat="{:.6f}" lon="{:.6f}">\n    <name>{}</name>\n    <desc>{}</desc>\n    <sym>{}</sym>\n  </wpt>\n'
+_TRKPT_FMT = '      <trkpt lat="%.6f" lon="%.6f"/>\n'
+
+# Text manifest separators and per-stop block
+_EQ70 = "=" * 70
+_SEP70 = "-" * 70
+_STOP_TMPL = "  {}. {}\n     {}\n     Phone: {}{}\n"
+
+# Optional leading 1 country code, then area code, exchange and line number,
+# allowing any separators between them
+_PHONE_RE = re.compile(r'(?:\+?1\D*)?(\d{3})\D*(\d{3})\D*(\d{4})')
+
+_get_stop_count = attrgetter('stop_count')
+_get_total_distance = attrgetter('total_distance')
 
 
 def format_phone_simple(phone: str) -> str:
     """Simple phone formatting for GPX description."""
     if not phone:
         return "N/A"
-    digits = ''.join(c for c in phone if c.isdigit())
-    if len(digits) >= 10:
-        return f"({digits[:3]}) {digits[3:6]}-{digits[6:10]}"
+    match = _PHONE_RE.search(phone)
+    if match:
+        return f"({match[1]}) {match[2]}-{match[3]}"
     return phone
 
 
+def _format_track_points(lats, lons) -> str:
+    """Format a whole track segment with a single %-format call."""
+    values = [None] * (2 * len(lats))
+    values[0::2] = lats
+    values[1::2] = lons
+    return (_TRKPT_FMT * len(lats)) % tuple(values)
+
+
 def generate_gpx(route, depot_lat: float = None, depot_lon: float = None,
-                 depot_name: str = "Depot") -> str:
+                 depot_name: str = "Depot", timestamp: datetime = None) -> str:
     """
     Generate OsmAnd-compatible GPX file for a route.
 
     Args:
-        route: Route object with beneficiaries
+        route: Route object with beneficiaries and their lats/lons
         depot_lat: Optional depot latitude
         depot_lon: Optional depot longitude
         depot_name: Name for depot waypoint
+        timestamp: Optional UTC creation time (defaults to now)
 
     Returns:
         GPX file content as string
     """
-    gpx = gpxpy.gpx.GPX()
-    gpx.creator = "Humanitarian Aid Delivery Router"
+    # Depot waypoints and track point are built once up front, so the rest
+    # of the function runs the same straight-line path with or without one
+    if depot_lat is not None and depot_lon is not None:
+        start_wpt = _WPT_TMPL.format(
+            depot_lat, depot_lon,
+            escape(f"START: {depot_name}"),
+            "Departure point / Punto de salida",
+            "Flag, Blue"
+        )
+        end_wpt = _WPT_TMPL.format(
+            depot_lat, depot_lon,
+            escape(f"END: {depot_name}"),
+            "Return point / Punto de regreso",
+            "Flag, Blue"
+        )
+        depot_trkpt = _TRKPT_FMT % (depot_lat, depot_lon)
+    else:
+        start_wpt = end_wpt = depot_trkpt = ""
+
+    parts = [_GPX_HEADER]
 
     # Add metadata
-    gpx.name = f"Delivery Route {route.route_number}"
-    gpx.description = f"Route with {route.stop_count} stops"
-    gpx.time = datetime.utcnow()
+    parts.append(_METADATA_TMPL.format(
+        f"Delivery Route {route.route_number}",
+        f"Route with {route.stop_count} stops",
+        (timestamp or datetime.utcnow()).strftime('%Y-%m-%dT%H:%M:%SZ')
+    ))
 
-    # Add depot as first waypoint if provided
-    if depot_lat is not None and depot_lon is not None:
-        depot_wpt = gpxpy.gpx.GPXWaypoint(
-            latitude=depot_lat,
-            longitude=depot_lon,
-            name=f"START: {depot_name}",
-            description="Departure point / Punto de salida"
-        )
-        depot_wpt.symbol = "Flag, Blue"
-        gpx.waypoints.append(depot_wpt)
+    # Depot as first waypoint (empty if none)
+    parts.append(start_wpt)
 
     # Add beneficiary waypoints in order
     for i, beneficiary in enumerate(route.beneficiaries, start=1):
@@ -65,66 +111,38 @@ def generate_gpx(route, depot_lat: float = None, depot_lon: float = None,
         if beneficiary.notes:
             description_parts.append(f"Notes: {beneficiary.notes}")
 
-        wpt = gpxpy.gpx.GPXWaypoint(
-            latitude=beneficiary.latitude,
-            longitude=beneficiary.longitude,
-            name=f"{i}. {beneficiary.name}",
-            description="\n".join(description_parts)
-        )
-
         # OsmAnd-compatible symbol
-        wpt.symbol = "Flag, Green"
-        gpx.waypoints.append(wpt)
+        parts.append(_WPT_TMPL.format(
+            beneficiary.latitude, beneficiary.longitude,
+            escape(f"{i}. {beneficiary.name}"),
+            escape("\n".join(description_parts)),
+            "Flag, Green"
+        ))
 
-    # Add depot as last waypoint (return) if provided
-    if depot_lat is not None and depot_lon is not None:
-        return_wpt = gpxpy.gpx.GPXWaypoint(
-            latitude=depot_lat,
-            longitude=depot_lon,
-            name=f"END: {depot_name}",
-            description="Return point / Punto de regreso"
-        )
-        return_wpt.symbol = "Flag, Blue"
-        gpx.waypoints.append(return_wpt)
+    # Depot as last waypoint (return)
+    parts.append(end_wpt)
 
     # Create a track showing the actual road route
-    gpx_track = gpxpy.gpx.GPXTrack()
-    gpx_track.name = f"Route {route.route_number} Track"
-    gpx.tracks.append(gpx_track)
-
-    gpx_segment = gpxpy.gpx.GPXTrackSegment()
-    gpx_track.segments.append(gpx_segment)
+    parts.append(f"  <trk>\n    <name>Route {route.route_number} Track</name>\n    <trkseg>\n")
 
     # Check if we have OSRM road geometry
     route_geometry = getattr(route, 'route_geometry', None) or []
 
     if route_geometry:
         # Use actual road coordinates from OSRM
-        for coord in route_geometry:
-            # OSRM returns [lon, lat], GPX needs (lat, lon)
-            lon, lat = coord[0], coord[1]
-            gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon))
+        # OSRM returns [lon, lat], GPX needs (lat, lon)
+        lons, lats, *_ = zip(*route_geometry)
+        parts.append(_format_track_points(lats, lons))
     else:
-        # Fallback: connect waypoints directly (straight lines)
-        # Add depot to track if provided
-        if depot_lat is not None and depot_lon is not None:
-            gpx_segment.points.append(
-                gpxpy.gpx.GPXTrackPoint(depot_lat, depot_lon)
-            )
+        # Fallback: connect waypoints directly (straight lines),
+        # starting and ending at the depot if provided
+        parts.append(depot_trkpt)
+        parts.append(_format_track_points(route.lats, route.lons))
+        parts.append(depot_trkpt)
 
-        # Add beneficiary locations to track
-        for beneficiary in route.beneficiaries:
-            gpx_segment.points.append(
-                gpxpy.gpx.GPXTrackPoint(beneficiary.latitude, beneficiary.longitude)
-            )
+    parts.append("    </trkseg>\n  </trk>\n</gpx>")
 
-        # Return to depot if provided
-        if depot_lat is not None and depot_lon is not None:
-            gpx_segment.points.append(
-                gpxpy.gpx.GPXTrackPoint(depot_lat, depot_lon)
-            )
-
-    return gpx.to_xml()
+    return "".join(parts)
 
 
 def generate_all_gpx(routes: List, depot_lat: float = None, depot_lon: float = None,
@@ -142,76 +160,77 @@ def generate_all_gpx(routes: List, depot_lat: float = None, depot_lon: float = N
         List of (filename, gpx_content) tuples
     """
     results = []
+    timestamp = datetime.utcnow()
 
     for route in routes:
         filename = f"route_{route.route_number:02d}.gpx"
-        content = generate_gpx(route, depot_lat, depot_lon, depot_name)
+        content = generate_gpx(route, depot_lat, depot_lon, depot_name, timestamp)
         results.append((filename, content))
 
     return results
 
 
-def generate_manifest_json(routes: List, depot_address: str = None) -> dict:
+def generate_manifest_json(routes: List, depot_address: str = None, generated: datetime = None) -> dict:
     """
     Generate a JSON manifest with route assignments for use by packing slip generator.
 
     Args:
         routes: List of Route objects
         depot_address: Optional depot address
+        generated: Optional generation time (defaults to now)
 
     Returns:
         Dictionary with route assignments
     """
     manifest = {
-        'generated': datetime.now().strftime('%Y-%m-%d %H:%M'),
+        'generated': (generated or datetime.now()).strftime('%Y-%m-%d %H:%M'),
         'depot_address': depot_address,
         'total_routes': len(routes),
-        'total_stops': sum(r.stop_count for r in routes),
-        'routes': []
+        'total_stops': sum(map(_get_stop_count, routes)),
+        'routes': [
+            {
+                'route_number': route.route_number,
+                'stop_count': route.stop_count,
+                'total_distance': route.total_distance,
+                'estimated_duration': route.estimated_duration,
+                'beneficiaries': [
+                    {
+                        'sequence': i,
+                        'name': b.name,
+                        'phone': b.phone,
+                        'address': b.address,
+                        'household_size': b.household_size,
+                        'items_needed': b.items_needed,
+                        'special_items': b.special_items,
+                        'notes': b.notes
+                    }
+                    for i, b in enumerate(route.beneficiaries, start=1)
+                ]
+            }
+            for route in routes
+        ]
     }
 
-    for route in routes:
-        route_data = {
-            'route_number': route.route_number,
-            'stop_count': route.stop_count,
-            'total_distance': route.total_distance,
-            'estimated_duration': route.estimated_duration,
-            'beneficiaries': []
-        }
-
-        for i, b in enumerate(route.beneficiaries, start=1):
-            route_data['beneficiaries'].append({
-                'sequence': i,
-                'name': b.name,
-                'phone': b.phone,
-                'address': b.address,
-                'household_size': b.household_size,
-                'items_needed': b.items_needed,
-                'special_items': b.special_items,
-                'notes': b.notes
-            })
-
-        manifest['routes'].append(route_data)
-
     return manifest
 
 
-def generate_manifest(routes: List, depot_address: str = None) -> str:
+def generate_manifest(routes: List, depot_address: str = None, generated: datetime = None) -> str:
     """
     Generate a text manifest summarizing all routes.
 
     Args:
         routes: List of Route objects
         depot_address: Optional depot address
+        generated: Optional generation time (defaults to now)
 
     Returns:
         Manifest text content
     """
     lines = [
-        "=" * 70,
+        _EQ70,
         "DELIVERY ROUTE MANIFEST / MANIFIESTO DE RUTAS DE ENTREGA",
-        "=" * 70,
-        f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+        _EQ70,
+        f"Generated: {(generated or datetime.now()).strftime('%Y-%m-%d %H:%M')}",
         ""
     ]
 
@@ -221,15 +240,15 @@ def generate_manifest(routes: List, depot_address: str = None) -> str:
             ""
         ])
 
-    total_stops = sum(r.stop_count for r in routes)
-    total_distance = sum(r.total_distance for r in routes)
+    total_stops = sum(map(_get_stop_count, routes))
+    total_distance = sum(map(_get_total_distance, routes))
 
     lines.extend([
         f"Total Routes: {len(routes)}",
         f"Total Stops: {total_stops}",
         f"Total Distance: {total_distance * 0.621371:.1f} miles" if total_distance > 0 else "",
         "",
-        "-" * 70,
+        _SEP70,
         ""
     ])
 
@@ -246,16 +265,16 @@ def generate_manifest(routes: List, depot_address: str = None) -> str:
 
         lines.append("")
 
-        for i, b in enumerate(route.beneficiaries, start=1):
-            phone_display = format_phone_simple(b.phone)
-            lines.append(f"  {i}. {b.name}")
-            lines.append(f"     {b.address}")
-            lines.append(f"     Phone: {phone_display}")
-            if b.special_items:
-                lines.append(f"     Special: {b.special_items}")
-            lines.append("")
+        # One preformatted block per stop, ending in the blank line between stops
+        lines.extend(
+            _STOP_TMPL.format(
+                i, b.name, b.address, format_phone_simple(b.phone),
+                f"\n     Special: {b.special_items}" if b.special_items else ""
+            )
+            for i, b in enumerate(route.beneficiaries, start=1)
+        )
 
-        lines.append("-" * 70)
+        lines.append(_SEP70)
         lines.append("")
 
     return "\n".join(lines)
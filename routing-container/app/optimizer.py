@@ -1,8 +1,30 @@
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import permutations
+from operator import attrgetter
 from typing import List, Tuple, Optional
 from dataclasses import dataclass
 import numpy as np
+from scipy.spatial import cKDTree
 from sklearn.cluster import KMeans
+from app.distance import calculate_distances
+
+
+# Shared keep-alive session for OSRM requests, fanned out over a few threads
+# (kept small to stay polite to the public demo server)
+_OSRM_MAX_WORKERS = 4
+_session = requests.Session()
+_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=_OSRM_MAX_WORKERS))
+_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=_OSRM_MAX_WORKERS))
+
+# Routes up to this many stops are ordered exactly (by trying every
+# permutation) when OSRM isn't used, instead of by nearest-neighbor
+_EXACT_ORDER_MAX_STOPS = 6
+
+# Nearest clusters checked through the KD-tree before falling back to a full scan
+_MERGE_CANDIDATES = 8
 
 
 @dataclass
@@ -13,31 +35,37 @@ class Route:
     total_distance: float = 0.0
     estimated_duration: float = 0.0  # in minutes
     route_geometry: list = None  # List of [lon, lat] road coordinates from OSRM
+    lats: np.ndarray = None  # Stop latitudes in route order
+    lons: np.ndarray = None  # Stop longitudes in route order
 
     def __post_init__(self):
         if self.route_geometry is None:
             self.route_geometry = []
+        if self.lats is None or self.lons is None:
+            n = len(self.beneficiaries)
+            self.lats = np.fromiter((b.latitude for b in self.beneficiaries), dtype=np.float64, count=n)
+            self.lons = np.fromiter((b.longitude for b in self.beneficiaries), dtype=np.float64, count=n)
 
     @property
     def stop_count(self) -> int:
         return len(self.beneficiaries)
 
 
-def _cluster_centroid(cluster: list) -> Tuple[float, float]:
-    """Calculate the centroid of a cluster."""
-    if not cluster:
-        return (0.0, 0.0)
-    lat = sum(b.latitude for b in cluster) / len(cluster)
-    lon = sum(b.longitude for b in cluster) / len(cluster)
-    return (lat, lon)
+def _cluster_centroids(coords: np.ndarray, clusters: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute centroids and sizes of non-empty index clusters in one batch.
 
+    Returns:
+        Tuple of (centroids as an (n, 2) array, sizes as an int array)
+    """
+    sizes = np.fromiter((len(c) for c in clusters), dtype=int, count=len(clusters))
+    if not clusters:
+        return np.empty((0, 2)), sizes
 
-def _distance_between_clusters(cluster1: list, cluster2: list) -> float:
-    """Calculate distance between two cluster centroids."""
-    from app.geocoder import calculate_distance
-    c1 = _cluster_centroid(cluster1)
-    c2 = _cluster_centroid(cluster2)
-    return calculate_distance(c1[0], c1[1], c2[0], c2[1])
+    # Sum each cluster's contiguous run of rows with a single reduceat call
+    offsets = np.concatenate(([0], np.cumsum(sizes[:-1])))
+    sums = np.add.reduceat(coords[np.concatenate(clusters)], offsets, axis=0)
+    return sums / sizes[:, None], sizes
 
 
 def cluster_beneficiaries(beneficiaries: list, max_stops_per_route: int = 4,
@@ -62,8 +90,9 @@ def cluster_beneficiaries(beneficiaries: list, max_stops_per_route: int = 4,
     if len(geocoded) <= max_stops_per_route:
         return [geocoded]
 
-    # Extract coordinates
-    coords = np.array([[b.latitude, b.longitude] for b in geocoded])
+    # Extract coordinates once - clustering below works on row indices
+    # into this array and only maps back to beneficiaries at the end
+    coords = np.array(list(map(attrgetter('latitude', 'longitude'), geocoded)), dtype=np.float64)
 
     # Calculate number of clusters - aim for clusters around the middle of min/max
     target_size = (min_stops_per_route + max_stops_per_route) // 2
@@ -72,14 +101,15 @@ def cluster_beneficiaries(beneficiaries: list, max_stops_per_route: int = 4,
     # Ensure we don't have more clusters than points
     n_clusters = min(n_clusters, len(geocoded))
 
-    # Perform K-Means clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    # Perform K-Means clustering - a single seeded k-means++ run is plenty
+    # for grouping stops into routes; clusters are split and merged below anyway
+    kmeans = KMeans(n_clusters=n_clusters, init='k-means++', n_init=1, random_state=42)
     labels = kmeans.fit_predict(coords)
 
-    # Group beneficiaries by cluster
+    # Group beneficiary indices by cluster
     clusters = [[] for _ in range(n_clusters)]
-    for beneficiary, label in zip(geocoded, labels):
-        clusters[label].append(beneficiary)
+    for i, label in enumerate(labels):
+        clusters[label].append(i)
 
     # Remove empty clusters
     clusters = [c for c in clusters if c]
@@ -90,22 +120,24 @@ def cluster_beneficiaries(beneficiaries: list, max_stops_per_route: int = 4,
         if len(cluster) <= max_stops_per_route:
             split_clusters.append(cluster)
         else:
-            # Split large cluster into chunks respecting min/max
-            remaining = cluster.copy()
-            while remaining:
-                if len(remaining) <= max_stops_per_route:
-                    split_clusters.append(remaining)
+            # Split large cluster into chunks respecting min/max,
+            # walking a start index instead of re-slicing the remainder
+            start = 0
+            while start < len(cluster):
+                remaining = len(cluster) - start
+                if remaining <= max_stops_per_route:
+                    split_clusters.append(cluster[start:])
                     break
-                elif len(remaining) <= max_stops_per_route + min_stops_per_route:
+                elif remaining <= max_stops_per_route + min_stops_per_route:
                     # Can't split evenly - divide as evenly as possible
-                    half = len(remaining) // 2
-                    split_clusters.append(remaining[:half])
-                    split_clusters.append(remaining[half:])
+                    half = start + remaining // 2
+                    split_clusters.append(cluster[start:half])
+                    split_clusters.append(cluster[half:])
                     break
                 else:
                     # Take max_stops
-                    split_clusters.append(remaining[:max_stops_per_route])
-                    remaining = remaining[max_stops_per_route:]
+                    split_clusters.append(cluster[start:start + max_stops_per_route])
+                    start += max_stops_per_route
 
     # Merge small clusters (below min_stops) with nearest neighbor
     final_clusters = []
@@ -115,44 +147,130 @@ def cluster_beneficiaries(beneficiaries: list, max_stops_per_route: int = 4,
     # First, add all large clusters
     final_clusters = large_clusters.copy()
 
+    # Centroids and sizes kept in step with final_clusters, so each small
+    # cluster finds its nearest candidate in one vectorized pass
+    centroids, sizes = _cluster_centroids(coords, final_clusters)
+
+    # KD-tree over those centroids on an equirectangular projection, so each
+    # small cluster usually only has to check its few nearest neighbors.
+    # Built once - later merges shift centroids slightly, which is fine for
+    # picking candidates; capacity is always checked against current sizes.
+    # Clusters appended after the build (index tree_size and up) aren't in
+    # the tree and are compared directly below.
+    lon_scale = np.cos(np.radians(coords[:, 0].mean()))
+    small_centroids, _ = _cluster_centroids(coords, small_clusters)
+    candidates = None
+    tree_size = len(centroids)
+    if len(centroids) and small_clusters:
+        tree = cKDTree(np.column_stack([centroids[:, 1] * lon_scale, centroids[:, 0]]))
+        # Nearest candidates for every small cluster in a single query
+        _, candidates = tree.query(
+            np.column_stack([small_centroids[:, 1] * lon_scale, small_centroids[:, 0]]),
+            k=min(_MERGE_CANDIDATES, tree.n)
+        )
+        candidates = candidates.reshape(len(small_clusters), -1)
+
     # Try to merge small clusters
-    for small in small_clusters:
+    for idx, small in enumerate(small_clusters):
+        if not small:
+            continue  # Already merged into another small cluster
+        small_clusters[idx] = []  # Mark as used
+
         merged = False
 
         # Find nearest cluster that can absorb this one
-        if final_clusters:
-            # Sort by distance to find nearest
-            candidates = [
-                (i, _distance_between_clusters(small, fc))
-                for i, fc in enumerate(final_clusters)
-                if len(fc) + len(small) <= max_stops_per_route
-            ]
-
-            if candidates:
-                candidates.sort(key=lambda x: x[1])
-                best_idx = candidates[0][0]
-                final_clusters[best_idx].extend(small)
-                merged = True
+        fits = sizes + len(small) <= max_stops_per_route
+        if fits.any():
+            lat, lon = small_centroids[idx]
+            best_idx = None
+
+            if candidates is not None:
+                for j in candidates[idx]:
+                    if fits[j]:
+                        best_idx = int(j)
+                        break
+
+            if best_idx is None:
+                # None of the nearest have room - scan every cluster
+                distances = calculate_distances(lat, lon, centroids[:, 0], centroids[:, 1])
+                distances[~fits] = np.inf
+                best_idx = int(np.argmin(distances))
+            elif len(centroids) > tree_size:
+                # Keep the tree's pick only if no appended cluster is closer
+                others = np.r_[best_idx, np.arange(tree_size, len(centroids))]
+                distances = calculate_distances(lat, lon, centroids[others, 0], centroids[others, 1])
+                distances[~fits[others]] = np.inf
+                best_idx = int(others[np.argmin(distances)])
+
+            final_clusters[best_idx].extend(small)
+            centroids[best_idx] = coords[final_clusters[best_idx]].mean(axis=0)
+            sizes[best_idx] = len(final_clusters[best_idx])
+            merged = True
 
         if not merged:
             # Can't merge - check if we can merge with another small cluster
+            new_cluster = None
             for i, other_small in enumerate(small_clusters):
                 if other_small is not small and len(small) + len(other_small) <= max_stops_per_route:
                     if len(small) + len(other_small) >= min_stops_per_route:
                         # Merge these two small clusters
-                        final_clusters.append(small + other_small)
+                        new_cluster = small + other_small
                         small_clusters[i] = []  # Mark as used
-                        merged = True
                         break
 
-            if not merged:
+            if new_cluster is None:
                 # Geographic outlier - add as its own route
-                final_clusters.append(small)
+                new_cluster = small
+
+            final_clusters.append(new_cluster)
+            centroids = np.vstack([centroids, coords[new_cluster].mean(axis=0)])
+            sizes = np.append(sizes, len(new_cluster))
+
+    # Remove any empty clusters and map indices back to beneficiaries
+    return [[geocoded[i] for i in c] for c in final_clusters if c]
+
+
+@lru_cache(maxsize=128)
+def _osrm_trip(coords_str: str, has_depot: bool) -> Tuple[float, float, tuple, tuple]:
+    """
+    Fetch an OSRM trip for a coordinate string.
+
+    Memoized so re-running route generation on unchanged clusters doesn't
+    repeat the network round trip. Failures raise and are not cached.
+    Results are immutable tuples, so callers can't alter a cached entry.
+
+    Returns:
+        Tuple of (distance in meters, duration in seconds, optimized
+        position of each input coordinate, road geometry as (lon, lat) pairs)
+
+    Raises:
+        requests.RequestException: On network errors
+        ValueError: If OSRM could not solve the trip
+    """
+    # OSRM demo server (for production, use your own server)
+    # Using roundtrip=true which is well-supported by the demo server
+    url = f"http://router.project-osrm.org/trip/v1/driving/{coords_str}"
+    params = {
+        "roundtrip": "true",
+        "geometries": "geojson",
+        "overview": "full"  # Get full road geometry for GPX
+    }
+
+    # If we have a depot, set it as fixed start point
+    if has_depot:
+        params["source"] = "first"
+
+    response = _session.get(url, params=params, timeout=30)
+    response.raise_for_status()
+    data = response.json()
 
-    # Remove any empty clusters
-    final_clusters = [c for c in final_clusters if c]
+    if data.get("code") != "Ok":
+        raise ValueError(f"OSRM trip failed: {data.get('code')}")
 
-    return final_clusters
+    trip = data.get("trips", [{}])[0]
+    waypoint_order = tuple(wp.get("waypoint_index", i) for i, wp in enumerate(data.get("waypoints", [])))
+    geometry = tuple(map(tuple, trip.get("geometry", {}).get("coordinates", [])))
+    return trip.get("distance", 0), trip.get("duration", 0), waypoint_order, geometry
 
 
 def optimize_route_osrm(beneficiaries: list, depot_lat: float = None, depot_lon: float = None) -> Tuple[list, float, float, list]:
@@ -184,41 +302,13 @@ def optimize_route_osrm(beneficiaries: list, depot_lat: float = None, depot_lon:
 
     coords_str = ";".join(coords)
 
-    # OSRM demo server (for production, use your own server)
-    # Using roundtrip=true which is well-supported by the demo server
-    url = f"http://router.project-osrm.org/trip/v1/driving/{coords_str}"
-    params = {
-        "roundtrip": "true",
-        "geometries": "geojson",
-        "overview": "full"  # Get full road geometry for GPX
-    }
-
-    # If we have a depot, set it as fixed start point
-    if has_depot:
-        params["source"] = "first"
-
     try:
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("code") != "Ok":
-            # OSRM failed, fall back to simple optimization
-            return optimize_route_simple(beneficiaries, depot_lat, depot_lon), 0.0, 0.0, []
-
-        # Extract trip info
-        trip = data.get("trips", [{}])[0]
-        distance_m = trip.get("distance", 0)
-        duration_s = trip.get("duration", 0)
-
-        # Extract route geometry (actual road coordinates)
-        geometry = trip.get("geometry", {})
-        route_coords = geometry.get("coordinates", [])  # List of [lon, lat] pairs
+        distance_m, duration_s, waypoint_order, geometry = _osrm_trip(coords_str, has_depot)
 
-        # Get optimized waypoint order
-        waypoints = data.get("waypoints", [])
+        # Route geometry (actual road coordinates) as a list of (lon, lat) pairs
+        route_coords = list(geometry)
 
-        if not waypoints:
+        if not waypoint_order:
             return optimize_route_simple(beneficiaries, depot_lat, depot_lon), 0.0, 0.0, []
 
         # If depot was included, skip it in reordering
@@ -228,9 +318,9 @@ def optimize_route_osrm(beneficiaries: list, depot_lat: float = None, depot_lon:
         # waypoint_index tells us where each point goes in the optimized route
         ordered = [None] * len(beneficiaries)
 
-        for i, wp in enumerate(waypoints):
+        for i, waypoint_index in enumerate(waypoint_order):
             original_idx = i - offset  # Original position in beneficiaries list
-            optimized_pos = wp.get("waypoint_index", i) - offset  # New position
+            optimized_pos = waypoint_index - offset  # New position
 
             if original_idx >= 0 and original_idx < len(beneficiaries):
                 if optimized_pos >= 0 and optimized_pos < len(beneficiaries):
@@ -244,6 +334,9 @@ def optimize_route_osrm(beneficiaries: list, depot_lat: float = None, depot_lon:
 
         return ordered, distance_m / 1000, duration_s / 60, route_coords
 
+    except ValueError:
+        # OSRM failed, fall back to simple optimization
+        return optimize_route_simple(beneficiaries, depot_lat, depot_lon), 0.0, 0.0, []
     except requests.RequestException:
         # Network error, fall back to simple optimization
         return optimize_route_simple(beneficiaries, depot_lat, depot_lon), 0.0, 0.0, []
@@ -252,33 +345,69 @@ def optimize_route_osrm(beneficiaries: list, depot_lat: float = None, depot_lon:
         return optimize_route_simple(beneficiaries, depot_lat, depot_lon), 0.0, 0.0, []
 
 
+def _exact_order(matrix: list, depot_distances: Optional[list]) -> tuple:
+    """
+    Find the shortest stop order for a small route by trying every permutation.
+
+    Args:
+        matrix: Pairwise stop distances as nested lists
+        depot_distances: Distances from the depot to each stop, or None.
+            With a depot the route is a round trip from it; without one
+            it is an open path that may start at any stop.
+
+    Returns:
+        Tuple of stop indices in visiting order
+    """
+    best_order, best_length = None, float('inf')
+    for order in permutations(range(len(matrix))):
+        length = sum(matrix[a][b] for a, b in zip(order, order[1:]))
+        if depot_distances is not None:
+            length += depot_distances[order[0]] + depot_distances[order[-1]]
+        if length < best_length:
+            best_order, best_length = order, length
+    return best_order
+
+
 def optimize_route_simple(beneficiaries: list, depot_lat: float = None, depot_lon: float = None) -> list:
     """
-    Simple nearest-neighbor route optimization.
+    Simple route optimization - exact for small routes, nearest-neighbor otherwise.
     Fallback when OSRM is unavailable.
     """
     if len(beneficiaries) <= 1:
         return beneficiaries
 
-    from app.geocoder import calculate_distance
+    n = len(beneficiaries)
+    lats = np.fromiter((b.latitude for b in beneficiaries), dtype=np.float64, count=n)
+    lons = np.fromiter((b.longitude for b in beneficiaries), dtype=np.float64, count=n)
+
+    # Within a cluster a local equirectangular projection stands in for
+    # Haversine; nearest-neighbor only ranks distances, so they stay squared
+    lon_scale = np.cos(np.radians(lats.mean()))
+    xs = lons * lon_scale
+    ys = lats
+
+    # Pairwise distances are computed once; each step then reads one row
+    matrix = (xs[:, None] - xs[None, :]) ** 2 + (ys[:, None] - ys[None, :]) ** 2
 
     # Start from depot or first point
     if depot_lat and depot_lon:
-        current_lat, current_lon = depot_lat, depot_lon
+        distances = (xs - depot_lon * lon_scale) ** 2 + (ys - depot_lat) ** 2
     else:
-        current_lat = beneficiaries[0].latitude
-        current_lon = beneficiaries[0].longitude
+        distances = matrix[0]
 
-    remaining = beneficiaries.copy()
-    ordered = []
+    if n <= _EXACT_ORDER_MAX_STOPS:
+        depot_distances = np.sqrt(distances).tolist() if depot_lat and depot_lon else None
+        order = _exact_order(np.sqrt(matrix).tolist(), depot_distances)
+        return [beneficiaries[i] for i in order]
 
-    while remaining:
-        # Find nearest unvisited
-        nearest = min(remaining,
-                      key=lambda b: calculate_distance(current_lat, current_lon, b.latitude, b.longitude))
-        ordered.append(nearest)
-        remaining.remove(nearest)
-        current_lat, current_lon = nearest.latitude, nearest.longitude
+    ordered = []
+    for _ in range(n):
+        # Find nearest unvisited - visited points have their matrix
+        # column set to infinity, so rows need no per-step masking
+        nearest = int(distances.argmin())
+        ordered.append(beneficiaries[nearest])
+        matrix[:, nearest] = np.inf
+        distances = matrix[nearest]
 
     return ordered
 
@@ -303,15 +432,16 @@ def create_routes(beneficiaries: list, max_stops: int = 4, min_stops: int = 3,
     # Cluster beneficiaries with min/max constraints
     clusters = cluster_beneficiaries(beneficiaries, max_stops, min_stops)
 
-    routes = []
-    for i, cluster in enumerate(clusters, start=1):
-        # Optimize order within cluster
-        if use_osrm:
-            ordered, distance, duration, geometry = optimize_route_osrm(cluster, depot_lat, depot_lon)
-        else:
-            ordered = optimize_route_simple(cluster, depot_lat, depot_lon)
-            distance, duration, geometry = 0.0, 0.0, []
+    # Optimize order within each cluster - OSRM requests are network bound,
+    # so they run concurrently
+    if use_osrm and clusters:
+        with ThreadPoolExecutor(max_workers=min(_OSRM_MAX_WORKERS, len(clusters))) as executor:
+            results = list(executor.map(lambda c: optimize_route_osrm(c, depot_lat, depot_lon), clusters))
+    else:
+        results = [(optimize_route_simple(c, depot_lat, depot_lon), 0.0, 0.0, []) for c in clusters]
 
+    routes = []
+    for i, (ordered, distance, duration, geometry) in enumerate(results, start=1):
         # Assign route numbers and sequences
         for seq, beneficiary in enumerate(ordered, start=1):
             beneficiary.route_number = i
@@ -1,9 +1,19 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, send_file, flash, jsonify, current_app
+from flask import (Blueprint, render_template, request, session, redirect, url_for, send_file, flash, jsonify,
+                   current_app, Response, stream_with_context)
 import io
+import gzip
 import zipfile
 import json
+import orjson
 import uuid
 import os
+import time
+import copy
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from app.csv_parser import parse_csv, Beneficiary
 from app.geocoder import geocode_beneficiaries, geocode_address, export_failed_geocodes
 from app.optimizer import create_routes
@@ -11,6 +21,32 @@ from app.gpx_generator import generate_gpx, generate_manifest, generate_manifest
 
 bp = Blueprint('main', __name__)
 
+# Geocoding is rate limited to ~1 address/second, so it runs in the
+# background and the review page follows its progress until it finishes.
+# Jobs running in this process, keyed by data_id: {'token', 'done', 'total'}
+_geocode_executor = ThreadPoolExecutor(max_workers=2)
+_geocode_jobs = {}
+
+# Longest a progress stream stays open before the client has to reconnect
+_PROGRESS_STREAM_SECONDS = 300
+
+# Parsed session data kept in memory, keyed by data file path and checked
+# against the file's mtime/size so writes from other workers are picked up.
+# Loaded dicts are shared - handlers that modify one must save it.
+_DATA_CACHE_SIZE = 32
+_data_cache = OrderedDict()
+_data_cache_lock = threading.Lock()
+
+# Route wrappers, manifests and generated GPX built from a session's stored
+# routes, keyed by data_id and reused until /generate produces a new routes_version
+_outputs_cache = OrderedDict()
+_outputs_lock = threading.Lock()
+
+
+def _data_file_path(data_id):
+    """Get path to a session's gzip-compressed data file."""
+    return os.path.join(current_app.config['DATA_DIR'], f'{data_id}.json.gz')
+
 
 def _get_data_file():
     """Get path to current session's data file."""
@@ -19,26 +55,79 @@ def _get_data_file():
         data_id = str(uuid.uuid4())
         session['data_id'] = data_id
         session.modified = True
-    return os.path.join(current_app.config['DATA_DIR'], f'{data_id}.json')
+    return _data_file_path(data_id)
+
+
+def _cache_data(data_file, stat, data):
+    """Remember parsed data for a data file at the given stat result."""
+    with _data_cache_lock:
+        _data_cache[data_file] = ((stat.st_mtime_ns, stat.st_size), data)
+        _data_cache.move_to_end(data_file)
+        while len(_data_cache) > _DATA_CACHE_SIZE:
+            _data_cache.popitem(last=False)
+
+
+def _evict_data(data_file):
+    """Drop a data file from the in-memory cache."""
+    with _data_cache_lock:
+        _data_cache.pop(data_file, None)
+
+
+def _read_data_file(data_file):
+    """Load data from a session data file."""
+    try:
+        stat = os.stat(data_file)
+    except OSError:
+        return {}
+
+    with _data_cache_lock:
+        cached = _data_cache.get(data_file)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            _data_cache.move_to_end(data_file)
+            return cached[1]
+
+    try:
+        with open(data_file, 'rb') as f:
+            data = orjson.loads(gzip.decompress(f.read()))
+    except (orjson.JSONDecodeError, gzip.BadGzipFile, EOFError, IOError):
+        return {}
+    _cache_data(data_file, stat, data)
+    return data
+
+
+def _write_data_file(data_file, data):
+    """Save data to a session data file."""
+    # Route geometry makes these files large; level 1 compresses the JSON
+    # several-fold for much less than the cost of producing it
+    with open(data_file, 'wb') as f:
+        f.write(gzip.compress(orjson.dumps(data), compresslevel=1))
+    _cache_data(data_file, os.stat(data_file), data)
 
 
 def _load_data():
     """Load data from file."""
-    data_file = _get_data_file()
-    if os.path.exists(data_file):
-        try:
-            with open(data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {}
+    return _read_data_file(_get_data_file())
 
 
 def _save_data(data):
     """Save data to file."""
-    data_file = _get_data_file()
-    with open(data_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f)
+    _write_data_file(_get_data_file(), data)
+
+
+def _geocoding_in_progress(data):
+    """Check whether a background geocoding job is running for this data."""
+    job = data.get('geocoding')
+    if not job:
+        return False
+    if job['pid'] == os.getpid():
+        running = _geocode_jobs.get(session.get('data_id'))
+        return running is not None and running['token'] == job['token']
+    # Started by another worker process - running as long as it is alive
+    try:
+        os.kill(job['pid'], 0)
+    except OSError:
+        return False
+    return True
 
 
 @bp.route('/')
@@ -47,6 +136,16 @@ def index():
     return render_template('index.html')
 
 
+def _parse_upload(file, encoding):
+    """Parse an uploaded CSV straight from its stream, decoding as it goes."""
+    file.stream.seek(0)
+    text = io.TextIOWrapper(file.stream, encoding=encoding, newline='')
+    try:
+        return parse_csv(text)
+    finally:
+        text.detach()  # Leave the upload stream open
+
+
 @bp.route('/upload', methods=['POST'])
 def upload():
     """Handle CSV file upload."""
@@ -64,17 +163,14 @@ def upload():
         return redirect(url_for('main.index'))
 
     try:
-        content = file.read().decode('utf-8-sig')  # Handle BOM
+        result = _parse_upload(file, 'utf-8-sig')  # Handle BOM
     except UnicodeDecodeError:
         try:
-            file.seek(0)
-            content = file.read().decode('latin-1')
+            result = _parse_upload(file, 'latin-1')
         except Exception as e:
             flash(f'Error reading file: {str(e)}', 'error')
             return redirect(url_for('main.index'))
 
-    result = parse_csv(content)
-
     if result.has_errors:
         for error in result.errors:
             flash(error, 'error')
@@ -119,10 +215,25 @@ def review():
         flash('Please upload a CSV file first', 'error')
         return redirect(url_for('main.index'))
 
+    # Report a finished background geocoding job once
+    summary = data.pop('geocode_summary', None)
+    if summary:
+        if summary.get('error'):
+            flash(summary['error'], 'error')
+        else:
+            flash(f"Geocoding complete: {summary['success']} successful, {summary['failed']} failed",
+                  'success' if summary['failed'] == 0 else 'warning')
+        _save_data(data)
+
+    geocoding = _geocoding_in_progress(data)
+    progress = _geocode_jobs.get(session.get('data_id')) if geocoding else None
+
     return render_template('review.html',
                            beneficiaries=data['beneficiaries'],
                            warnings=data.get('warnings', []),
                            geocoded=data.get('geocoded', False),
+                           geocoding=geocoding,
+                           progress=progress,
                            depot=data.get('depot', {}))
 
 
@@ -133,10 +244,14 @@ def update():
     if not data.get('beneficiaries'):
         return redirect(url_for('main.index'))
 
+    if _geocoding_in_progress(data):
+        flash('Please wait for geocoding to finish before making changes', 'warning')
+        return redirect(url_for('main.review'))
+
     beneficiaries = data['beneficiaries']
 
     # Update excluded status
-    excluded = request.form.getlist('exclude')
+    excluded = set(request.form.getlist('exclude'))
     for i, b in enumerate(beneficiaries):
         b['excluded'] = str(i) in excluded
 
@@ -156,66 +271,146 @@ def update():
 
 @bp.route('/geocode', methods=['POST'])
 def geocode():
-    """Geocode all beneficiary addresses."""
+    """Start geocoding all beneficiary addresses in the background."""
     data = _load_data()
     if not data.get('beneficiaries'):
         return jsonify({'error': 'No data loaded'}), 400
 
-    beneficiaries_data = data['beneficiaries']
-
-    # Convert to Beneficiary objects for geocoding
-    beneficiaries = []
-    for b in beneficiaries_data:
-        beneficiary = Beneficiary(
-            row_number=b['row_number'],
-            name=b['name'],
-            phone=b['phone'],
-            address=b['address'],
-            household_size=b.get('household_size', ''),
-            items_needed=b.get('items_needed', ''),
-            special_items=b.get('special_items', ''),
-            notes=b.get('notes', ''),
-            errors=b['errors'],
-            warnings=b['warnings'].copy(),
-            flagged=b['flagged'],
-            excluded=b.get('excluded', False)
-        )
-        beneficiaries.append(beneficiary)
-
-    # Geocode
-    geocode_beneficiaries(beneficiaries)
+    if _geocoding_in_progress(data):
+        flash('Geocoding is already in progress', 'info')
+        return redirect(url_for('main.review'))
 
-    # Update data
-    for i, b in enumerate(beneficiaries):
-        beneficiaries_data[i]['latitude'] = b.latitude
-        beneficiaries_data[i]['longitude'] = b.longitude
-        beneficiaries_data[i]['geocode_error'] = b.geocode_error
-        if b.geocode_error:
-            if b.geocode_error not in beneficiaries_data[i]['warnings']:
-                beneficiaries_data[i]['warnings'].append(f"Geocoding: {b.geocode_error}")
-            beneficiaries_data[i]['flagged'] = True
-
-    # Geocode depot if provided
-    depot = data.get('depot', {})
-    if depot.get('address'):
-        lat, lon, error = geocode_address(depot['address'])
-        depot['latitude'] = lat
-        depot['longitude'] = lon
-        depot['error'] = error
-        data['depot'] = depot
-
-    data['beneficiaries'] = beneficiaries_data
-    data['geocoded'] = True
+    data_id = session['data_id']
+    token = uuid.uuid4().hex
+    data['geocoding'] = {'token': token, 'pid': os.getpid()}
     _save_data(data)
 
-    # Count results
-    success = sum(1 for b in beneficiaries_data if b['latitude'] is not None and not b.get('excluded'))
-    failed = sum(1 for b in beneficiaries_data if b['latitude'] is None and not b.get('excluded') and len(b['errors']) == 0)
+    _geocode_jobs[data_id] = {'token': token, 'done': 0, 'total': 0}
+    _geocode_executor.submit(_run_geocoding, current_app._get_current_object(),
+                             data_id, _get_data_file(), token)
 
-    flash(f'Geocoding complete: {success} successful, {failed} failed', 'success' if failed == 0 else 'warning')
+    flash('Geocoding started - this page will refresh until it is complete', 'info')
     return redirect(url_for('main.review'))
 
 
+@bp.route('/geocode/progress')
+def geocode_progress():
+    """Stream background geocoding progress as newline-delimited JSON."""
+    data_id = session.get('data_id')
+    if not data_id:
+        return jsonify({'error': 'No data loaded'}), 400
+    data_file = _data_file_path(data_id)
+
+    def gen():
+        last = None
+        for _ in range(_PROGRESS_STREAM_SECONDS):
+            if not _geocoding_in_progress(_read_data_file(data_file)):
+                yield json.dumps({'status': 'complete'}) + '\n'
+                return
+            # Counts are only known to the worker process running the job
+            job = _geocode_jobs.get(data_id, {})
+            update = {'status': 'running', 'done': job.get('done'), 'total': job.get('total')}
+            if update != last:
+                yield json.dumps(update) + '\n'
+                last = update
+            else:
+                # Heartbeat - writing to a closed connection ends the stream
+                yield '\n'
+            time.sleep(1)
+        # Lifetime reached - the page reloads and opens a new stream
+
+    return Response(stream_with_context(gen()), mimetype='application/x-ndjson')
+
+
+def _run_geocoding(app, data_id, data_file, token):
+    """Geocode a session's beneficiaries and depot, then save the results."""
+    job = _geocode_jobs[data_id]
+    try:
+        # Work on a private copy - the cached dict is shared with request threads
+        data = copy.deepcopy(_read_data_file(data_file))
+        beneficiaries_data = data['beneficiaries']
+
+        # Convert to Beneficiary objects for geocoding - only rows that
+        # will actually be looked up (not excluded, no validation errors)
+        pending = [i for i, b in enumerate(beneficiaries_data) if not b.get('excluded') and not b['errors']]
+        beneficiaries = []
+        for i in pending:
+            b = beneficiaries_data[i]
+            beneficiary = Beneficiary(
+                row_number=b['row_number'],
+                name=b['name'],
+                phone=b['phone'],
+                address=b['address'],
+                household_size=b.get('household_size', ''),
+                items_needed=b.get('items_needed', ''),
+                special_items=b.get('special_items', ''),
+                notes=b.get('notes', ''),
+                errors=b['errors'],
+                warnings=b['warnings'].copy(),
+                flagged=b['flagged']
+            )
+            beneficiaries.append(beneficiary)
+
+        def progress(done, total):
+            job['done'], job['total'] = done, total
+
+        # Geocode
+        geocode_beneficiaries(beneficiaries, progress_callback=progress)
+
+        # Update data - skipped rows have no location
+        for b in beneficiaries_data:
+            b['latitude'] = b['longitude'] = None
+            b['geocode_error'] = ''
+        for i, b in zip(pending, beneficiaries):
+            beneficiaries_data[i]['latitude'] = b.latitude
+            beneficiaries_data[i]['longitude'] = b.longitude
+            beneficiaries_data[i]['geocode_error'] = b.geocode_error
+            if b.geocode_error:
+                # Compare the full message so re-geocoding doesn't add it twice
+                message = f"Geocoding: {b.geocode_error}"
+                if message not in beneficiaries_data[i]['warnings']:
+                    beneficiaries_data[i]['warnings'].append(message)
+                beneficiaries_data[i]['flagged'] = True
+
+        # Geocode depot if provided
+        depot = data.get('depot', {})
+        if depot.get('address'):
+            lat, lon, error = geocode_address(depot['address'])
+            depot['latitude'] = lat
+            depot['longitude'] = lon
+            depot['error'] = error
+            data['depot'] = depot
+
+        # Count results
+        success = failed = 0
+        for b in beneficiaries_data:
+            if b.get('excluded') or b['errors']:
+                continue
+            if b['latitude'] is not None:
+                success += 1
+            else:
+                failed += 1
+
+        data['beneficiaries'] = beneficiaries_data
+        data['geocoded'] = True
+        data['geocode_summary'] = {'success': success, 'failed': failed}
+        data.pop('geocoding', None)
+
+        # Only save if the session was not reset or re-uploaded meanwhile
+        current = _read_data_file(data_file)
+        if current.get('geocoding', {}).get('token') == token:
+            _write_data_file(data_file, data)
+    except Exception:
+        app.logger.exception('Background geocoding failed')
+        current = _read_data_file(data_file)
+        if current.get('geocoding', {}).get('token') == token:
+            current.pop('geocoding', None)
+            current['geocode_summary'] = {'error': 'Geocoding failed unexpectedly - please try again'}
+            _write_data_file(data_file, current)
+    finally:
+        _geocode_jobs.pop(data_id, None)
+
+
 @bp.route('/download/failed-geocodes')
 def download_failed_geocodes():
     """Download CSV of addresses that failed geocoding."""
@@ -229,18 +424,17 @@ def download_failed_geocodes():
         return redirect(url_for('main.review'))
 
     beneficiaries_data = data['beneficiaries']
-    csv_content = export_failed_geocodes(beneficiaries_data)
 
-    # Check if there are any failed geocodes
-    failed_count = sum(1 for b in beneficiaries_data
-                       if b.get('latitude') is None
-                       and not b.get('excluded')
-                       and len(b.get('errors', [])) == 0)
-
-    if failed_count == 0:
+    # Check if there are any failed geocodes before building the CSV
+    if not any(b.get('latitude') is None
+               and not b.get('excluded')
+               and not b.get('errors')
+               for b in beneficiaries_data):
         flash('No failed geocodes to download', 'info')
         return redirect(url_for('main.review'))
 
+    csv_content = export_failed_geocodes(beneficiaries_data)
+
     return send_file(
         io.BytesIO(csv_content.encode('utf-8')),
         mimetype='text/csv',
@@ -256,7 +450,7 @@ def generate():
     if not data.get('beneficiaries'):
         return redirect(url_for('main.index'))
 
-    if not data.get('geocoded'):
+    if not data.get('geocoded') or _geocoding_in_progress(data):
         flash('Please geocode addresses first', 'error')
         return redirect(url_for('main.review'))
 
@@ -346,35 +540,112 @@ def generate():
         for r in routes
     ]
     data['depot_address'] = depot.get('address')
+    data['routes_version'] = uuid.uuid4().hex
     _save_data(data)
 
+    with _outputs_lock:
+        _outputs_cache.pop(session.get('data_id'), None)
+
     return redirect(url_for('main.results'))
 
 
+@dataclass(slots=True)
+class _BeneficiaryWrapper:
+    """Stop read back from session data, in the shape generate_gpx expects."""
+    name: str
+    address: str
+    phone: str
+    latitude: float
+    longitude: float
+    household_size: str = ''
+    items_needed: str = ''
+    special_items: str = ''
+    notes: str = ''
+
+
+@dataclass(slots=True)
+class _RouteWrapper:
+    """Route read back from session data, in the shape generate_gpx expects."""
+    route_number: int
+    stop_count: int
+    total_distance: float
+    estimated_duration: float
+    route_geometry: list = field(default_factory=list)  # Road coordinates
+    beneficiaries: list = field(default_factory=list)
+    lats: list = field(default_factory=list)
+    lons: list = field(default_factory=list)
+
+
 def _build_route_for_gpx(route_data):
     """Build a route-like object for GPX generation from stored data."""
-    class RouteWrapper:
-        def __init__(self, data):
-            self.route_number = data['route_number']
-            self.stop_count = data['stop_count']
-            self.total_distance = data['total_distance']
-            self.estimated_duration = data['estimated_duration']
-            self.route_geometry = data.get('route_geometry', [])  # Road coordinates
-            self.beneficiaries = [BeneficiaryWrapper(b) for b in data['beneficiaries']]
-
-    class BeneficiaryWrapper:
-        def __init__(self, data):
-            self.name = data['name']
-            self.address = data['address']
-            self.phone = data['phone']
-            self.latitude = data['latitude']
-            self.longitude = data['longitude']
-            self.household_size = data.get('household_size', '')
-            self.items_needed = data.get('items_needed', '')
-            self.special_items = data.get('special_items', '')
-            self.notes = data.get('notes', '')
-
-    return RouteWrapper(route_data)
+    stops = route_data['beneficiaries']
+    return _RouteWrapper(
+        route_number=route_data['route_number'],
+        stop_count=route_data['stop_count'],
+        total_distance=route_data['total_distance'],
+        estimated_duration=route_data['estimated_duration'],
+        route_geometry=route_data.get('route_geometry', []),
+        beneficiaries=[_BeneficiaryWrapper(
+            name=b['name'],
+            address=b['address'],
+            phone=b['phone'],
+            latitude=b['latitude'],
+            longitude=b['longitude'],
+            household_size=b.get('household_size', ''),
+            items_needed=b.get('items_needed', ''),
+            special_items=b.get('special_items', ''),
+            notes=b.get('notes', '')
+        ) for b in stops],
+        lats=[b['latitude'] for b in stops],
+        lons=[b['longitude'] for b in stops]
+    )
+
+
+def _route_outputs(data):
+    """Get the route wrappers and manifests for the stored routes, building them once."""
+    data_id = session.get('data_id')
+    version = data.get('routes_version')
+    with _outputs_lock:
+        outputs = _outputs_cache.get(data_id)
+        if outputs and outputs['version'] == version:
+            _outputs_cache.move_to_end(data_id)
+            return outputs
+
+    routes = [_build_route_for_gpx(r) for r in data['routes']]
+    generated = datetime.now()
+    manifest = generate_manifest(routes, data.get('depot_address'), generated)
+    manifest_json = generate_manifest_json(routes, data.get('depot_address'), generated)
+    outputs = {
+        'version': version,
+        'routes': routes,
+        'manifest': manifest,
+        # Download bodies, encoded once
+        'manifest_bytes': manifest.encode('utf-8'),
+        'manifest_json_bytes': json.dumps(manifest_json, indent=2).encode('utf-8'),
+        'gpx': {}  # Route index -> GPX bytes, filled in as routes are downloaded
+    }
+
+    with _outputs_lock:
+        _outputs_cache[data_id] = outputs
+        _outputs_cache.move_to_end(data_id)
+        while len(_outputs_cache) > _DATA_CACHE_SIZE:
+            _outputs_cache.popitem(last=False)
+    return outputs
+
+
+def _route_gpx(data, outputs, index):
+    """Get the GPX file for one route, generating it on first download."""
+    content = outputs['gpx'].get(index)
+    if content is None:
+        depot_coords = data.get('depot_coords', {}) or {}
+        content = generate_gpx(
+            outputs['routes'][index],
+            depot_coords.get('lat'),
+            depot_coords.get('lon'),
+            depot_coords.get('name', 'Depot')
+        ).encode('utf-8')
+        outputs['gpx'][index] = content
+    return content
 
 
 @bp.route('/results')
@@ -387,9 +658,7 @@ def results():
     # Generate GPX file names for display
     gpx_files = [(f"route_{r['route_number']:02d}.gpx", '') for r in data['routes']]
 
-    # Generate manifest on-demand
-    routes = [_build_route_for_gpx(r) for r in data['routes']]
-    manifest = generate_manifest(routes, data.get('depot_address'))
+    manifest = _route_outputs(data)['manifest']
 
     return render_template('results.html',
                            routes=data['routes'],
@@ -409,19 +678,13 @@ def download_gpx(index):
         flash('File not found', 'error')
         return redirect(url_for('main.results'))
 
-    # Generate GPX on-demand
-    route = _build_route_for_gpx(routes[index])
-    depot_coords = data.get('depot_coords', {}) or {}
-    content = generate_gpx(
-        route,
-        depot_coords.get('lat'),
-        depot_coords.get('lon'),
-        depot_coords.get('name', 'Depot')
-    )
+    # Generate GPX on first download
+    outputs = _route_outputs(data)
+    content = _route_gpx(data, outputs, index)
 
-    filename = f"route_{route.route_number:02d}.gpx"
+    filename = f"route_{outputs['routes'][index].route_number:02d}.gpx"
     return send_file(
-        io.BytesIO(content.encode('utf-8')),
+        io.BytesIO(content),
         mimetype='application/gpx+xml',
         as_attachment=True,
         download_name=filename
@@ -435,12 +698,10 @@ def download_manifest():
     if not data.get('routes'):
         return redirect(url_for('main.index'))
 
-    # Generate manifest on-demand
-    routes = [_build_route_for_gpx(r) for r in data['routes']]
-    manifest = generate_manifest(routes, data.get('depot_address'))
+    manifest = _route_outputs(data)['manifest_bytes']
 
     return send_file(
-        io.BytesIO(manifest.encode('utf-8')),
+        io.BytesIO(manifest),
         mimetype='text/plain',
         as_attachment=True,
         download_name='route_manifest.txt'
@@ -454,18 +715,46 @@ def download_manifest_json():
     if not data.get('routes'):
         return redirect(url_for('main.index'))
 
-    # Generate JSON manifest on-demand
-    routes = [_build_route_for_gpx(r) for r in data['routes']]
-    manifest = generate_manifest_json(routes, data.get('depot_address'))
+    manifest = _route_outputs(data)['manifest_json_bytes']
 
     return send_file(
-        io.BytesIO(json.dumps(manifest, indent=2).encode('utf-8')),
+        io.BytesIO(manifest),
         mimetype='application/json',
         as_attachment=True,
         download_name='route_manifest.json'
     )
 
 
+class _ZipBuffer(io.RawIOBase):
+    """Unseekable write target for ZipFile that hands back what has been written."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _stream_zip(files):
+    """Yield a ZIP archive of (filename, bytes) pairs while it is being written."""
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for filename, content in files:
+            zf.writestr(filename, content)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
 @bp.route('/download/all')
 def download_all():
     """Download all files as ZIP."""
@@ -473,42 +762,20 @@ def download_all():
     if not data.get('routes'):
         return redirect(url_for('main.index'))
 
-    depot_coords = data.get('depot_coords', {}) or {}
-    routes_data = data['routes']
+    outputs = _route_outputs(data)
 
-    # Generate all GPX files on-demand
-    gpx_files = []
-    for route_data in routes_data:
-        route = _build_route_for_gpx(route_data)
-        content = generate_gpx(
-            route,
-            depot_coords.get('lat'),
-            depot_coords.get('lon'),
-            depot_coords.get('name', 'Depot')
-        )
-        filename = f"route_{route.route_number:02d}.gpx"
-        gpx_files.append((filename, content))
-
-    # Generate manifests on-demand
-    routes = [_build_route_for_gpx(r) for r in routes_data]
-    manifest_txt = generate_manifest(routes, data.get('depot_address'))
-    manifest_json = generate_manifest_json(routes, data.get('depot_address'))
-
-    # Create ZIP file in memory
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for filename, content in gpx_files:
-            zf.writestr(filename, content.encode('utf-8'))
-        zf.writestr('manifest.txt', manifest_txt.encode('utf-8'))
-        zf.writestr('route_manifest.json', json.dumps(manifest_json, indent=2).encode('utf-8'))
+    def files():
+        # GPX files are generated (and cached) as the archive reaches them
+        for index, route in enumerate(outputs['routes']):
+            yield f"route_{route.route_number:02d}.gpx", _route_gpx(data, outputs, index)
+        yield 'manifest.txt', outputs['manifest_bytes']
+        yield 'route_manifest.json', outputs['manifest_json_bytes']
 
-    zip_buffer.seek(0)
-
-    return send_file(
-        zip_buffer,
+    # Stream the ZIP as each file is compressed instead of building it in memory
+    return Response(
+        _stream_zip(files()),
         mimetype='application/zip',
-        as_attachment=True,
-        download_name='delivery_routes.zip'
+        headers={'Content-Disposition': 'attachment; filename=delivery_routes.zip'}
     )
 
 
@@ -518,7 +785,10 @@ def reset():
     # Delete data file
     data_id = session.get('data_id')
     if data_id:
-        data_file = os.path.join(current_app.config['DATA_DIR'], f'{data_id}.json')
+        data_file = _data_file_path(data_id)
+        _evict_data(data_file)
+        with _outputs_lock:
+            _outputs_cache.pop(data_id, None)
         if os.path.exists(data_file):
             os.remove(data_file)
     session.clear()
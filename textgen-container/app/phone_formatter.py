@@ -1,7 +1,42 @@
+import re
+from functools import lru_cache
+
 import phonenumbers
 from phonenumbers import NumberParseException
 
+# Numbers written with only digits and common separators, optionally after a +
+_PLAIN_PHONE_RE = re.compile(r'\+?[0-9 ().-]+')
+
+# NANP area codes and exchanges both start with 2-9
+_NANP_LEADING = frozenset('23456789')
+
+# Translation table deleting ASCII non-digits
+_NON_DIGITS = {c: None for c in range(128) if not chr(c).isdigit()}
+
 
+def _digits(text: str) -> str:
+    """Keep only the digits of a string."""
+    if text.isascii():
+        return text.translate(_NON_DIGITS)
+    return ''.join(c for c in text if c.isdigit())
+
+
+@lru_cache(maxsize=None)
+def _area_code_always_valid(area_code: str) -> bool:
+    """
+    Whether phonenumbers accepts every number under a NANP area code that has
+    a 2-9 exchange. Worked out once per area code by checking each exchange;
+    NANP metadata doesn't look past the exchange, so one line number will do.
+    """
+    return all(
+        phonenumbers.is_valid_number(
+            phonenumbers.PhoneNumber(country_code=1, national_number=int(f'{area_code}{exchange}0000'))
+        )
+        for exchange in range(200, 1000)
+    )
+
+
+@lru_cache(maxsize=4096)
 def format_phone(phone_str: str) -> tuple[str, bool]:
     """
     Normalize phone number to US format: (XXX) XXX-XXXX
@@ -14,6 +49,19 @@ def format_phone(phone_str: str) -> tuple[str, bool]:
 
     cleaned = phone_str.strip()
 
+    # Plain 10-digit US numbers (optionally with a leading 1) don't need
+    # the phonenumbers parser, as long as their area code is one it accepts
+    # with any exchange - anything else is still validated below
+    if _PLAIN_PHONE_RE.fullmatch(cleaned):
+        digits = _digits(cleaned)
+        if len(digits) == 11 and digits[0] == '1':
+            digits = digits[1:]
+        elif cleaned[0] == '+':
+            digits = ''
+        if (len(digits) == 10 and digits[0] in _NANP_LEADING and digits[3] in _NANP_LEADING
+                and _area_code_always_valid(digits[:3])):
+            return f"({digits[:3]}) {digits[3:6]}-{digits[6:]}", True
+
     try:
         # Try parsing as US number
         parsed = phonenumbers.parse(cleaned, 'US')
@@ -27,14 +75,14 @@ def format_phone(phone_str: str) -> tuple[str, bool]:
             return formatted, True
         else:
             # Invalid number - return cleaned digits
-            digits = ''.join(c for c in cleaned if c.isdigit())
+            digits = _digits(cleaned)
             if len(digits) >= 10:
                 return f"({digits[:3]}) {digits[3:6]}-{digits[6:10]}", False
             return cleaned, False
 
     except NumberParseException:
         # Fallback: try to format raw digits
-        digits = ''.join(c for c in cleaned if c.isdigit())
+        digits = _digits(cleaned)
         if len(digits) >= 10:
             return f"({digits[:3]}) {digits[3:6]}-{digits[6:10]}", True
         elif len(digits) > 0:
@@ -42,9 +90,17 @@ def format_phone(phone_str: str) -> tuple[str, bool]:
         return '', False
 
 
+def format_phones_bulk(phones) -> list[tuple[str, bool]]:
+    """
+    Format a batch of phone numbers, as format_phone would one at a time.
+    Repeated numbers are served from format_phone's cache.
+    """
+    return list(map(format_phone, phones))
+
+
 def extract_last_4_digits(phone_str: str) -> str:
     """Extract last 4 digits from phone number for filename generation."""
-    digits = ''.join(c for c in phone_str if c.isdigit())
+    digits = _digits(phone_str)
     if len(digits) >= 4:
         return digits[-4:]
     return digits.zfill(4)
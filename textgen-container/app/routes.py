@@ -1,43 +1,223 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, send_file, flash, current_app
+from flask import (Blueprint, render_template, request, session, redirect, url_for, send_file, flash, current_app, g,
+                   Response, make_response)
 import io
+import hashlib
 import zipfile
-import json
+import orjson
 import uuid
 import os
-from app.csv_parser import parse_csv, Beneficiary
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
+from app.csv_parser import parse_csv
 from app.text_generator import generate_all_slips, generate_all_slips_with_routes, generate_filename, generate_packing_slip
-from app.phone_formatter import format_phone
+from app.phone_formatter import format_phones_bulk
 
 bp = Blueprint('main', __name__)
 
+# Parsed session data kept in memory, keyed by data file path and checked
+# against the file's mtime/size so writes from other workers are picked up.
+# The files stay the source of truth; writes go through to disk.
+# Loaded dicts are shared - handlers that modify one must save it.
+# Entries idle for longer than the TTL are dropped so abandoned sessions
+# don't hold memory until pushed out by newer ones.
+_DATA_CACHE_SIZE = 32
+_DATA_CACHE_TTL = 30 * 60  # seconds
+_data_cache = OrderedDict()
+_data_cache_lock = threading.Lock()
+
+# Generated slips are written to disk in parallel - file IO releases the GIL
+_slip_writer = ThreadPoolExecutor(max_workers=4)
+
 
 def _get_data_file():
-    """Get path to current session's data file."""
-    data_id = session.get('data_id')
-    if not data_id:
-        data_id = str(uuid.uuid4())
-        session['data_id'] = data_id
-        session.modified = True
-    return os.path.join(current_app.config['DATA_DIR'], f'{data_id}.json')
+    """Get path to current session's data file, worked out once per request."""
+    if 'data_file' not in g:
+        data_id = session.get('data_id')
+        if not data_id:
+            data_id = str(uuid.uuid4())
+            session['data_id'] = data_id
+            session.modified = True
+        g.data_file = os.path.join(current_app.config['DATA_DIR'], f'{data_id}.json')
+    return g.data_file
+
+
+def _get_slips_dir(data_id):
+    """Get path to the directory holding a session's generated slip files."""
+    return os.path.join(current_app.config['DATA_DIR'], data_id)
+
+
+def _generated_slips_dir(data):
+    """
+    Get path to the directory holding the slips listed in the session data,
+    or None if they are missing or were stored by an older version.
+    """
+    generation = data.get('slips_generation')
+    if not generation:
+        return None
+    slips_dir = os.path.join(_get_slips_dir(session['data_id']), generation)
+    return slips_dir if os.path.isdir(slips_dir) else None
+
+
+def _slip_path(slips_dir, index):
+    """Get path to one generated slip file."""
+    return os.path.join(slips_dir, f'{index:04d}.txt')
+
+
+def _write_slips(data_id, slips):
+    """
+    Write generated slips to a fresh directory, leaving earlier runs in place
+    so downloads still reading them aren't cut off.
+
+    Returns:
+        Tuple of (generation directory name, list of [filename, size in bytes])
+        to keep in the session data
+    """
+    session_dir = _get_slips_dir(data_id)
+    os.makedirs(session_dir, exist_ok=True)
+    slips_dir = tempfile.mkdtemp(dir=session_dir)
+
+    contents = [content.encode('utf-8') for _, content in slips]
+    paths = [_slip_path(slips_dir, i) for i in range(len(slips))]
+    # Consume the results so a failed write raises here
+    list(_slip_writer.map(_write_file, paths, contents))
+
+    sizes = [[filename, len(content)] for (filename, _), content in zip(slips, contents)]
+    return os.path.basename(slips_dir), sizes
+
+
+def _prune_slips(data_id, keep):
+    """Remove a session's generated slip directories other than those in keep."""
+    with os.scandir(_get_slips_dir(data_id)) as entries:
+        for entry in entries:
+            if entry.name in keep:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+
+
+def _slips_unavailable():
+    """Send the user back to regenerate slips that can no longer be read."""
+    flash('Generated packing slips are no longer available - please generate them again', 'warning')
+    return redirect(url_for('main.review'))
+
+
+def _write_file(path, content):
+    """Write bytes to a file."""
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _read_slips(paths):
+    """Yield the contents of generated slip files, one at a time."""
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield f.read()
+
+
+def _expire_cached_data(now):
+    """Drop entries that have gone unused for the TTL. Call with the lock held."""
+    # Least recently used entries are at the front
+    while _data_cache and next(iter(_data_cache.values()))[2] < now - _DATA_CACHE_TTL:
+        _data_cache.popitem(last=False)
+
+
+def _cache_data(data_file, stat, data):
+    """Remember parsed data for a data file at the given stat result."""
+    now = time.monotonic()
+    with _data_cache_lock:
+        _data_cache[data_file] = ((stat.st_mtime_ns, stat.st_size), data, now)
+        _data_cache.move_to_end(data_file)
+        while len(_data_cache) > _DATA_CACHE_SIZE:
+            _data_cache.popitem(last=False)
+        _expire_cached_data(now)
+
+
+def _evict_data(data_file):
+    """Drop a data file from the in-memory cache."""
+    with _data_cache_lock:
+        _data_cache.pop(data_file, None)
+
+
+def _read_data_file(data_file):
+    """Load data from a session data file."""
+    try:
+        stat = os.stat(data_file)
+    except OSError:
+        return {}
+
+    now = time.monotonic()
+    with _data_cache_lock:
+        _expire_cached_data(now)
+        cached = _data_cache.get(data_file)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            _data_cache[data_file] = (cached[0], cached[1], now)
+            _data_cache.move_to_end(data_file)
+            return cached[1]
+
+    try:
+        with open(data_file, 'rb') as f:
+            data = orjson.loads(f.read())
+    except (orjson.JSONDecodeError, IOError):
+        return {}
+    _cache_data(data_file, stat, data)
+    return data
 
 
 def _load_data():
-    """Load data from file."""
-    data_file = _get_data_file()
-    if os.path.exists(data_file):
-        try:
-            with open(data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {}
+    """Load data from file, at most once per request."""
+    if 'session_data' not in g:
+        g.session_data = _read_data_file(_get_data_file())
+    return g.session_data
 
 
 def _save_data(data):
     """Save data to file."""
+    g.session_data = data
     data_file = _get_data_file()
-    with open(data_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f)
+
+    # Write a temporary file and rename it over the old one, so an interrupted
+    # save can't leave a truncated file that later loads as empty
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(data_file), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(orjson.dumps(data))
+            f.flush()
+            stat = os.fstat(f.fileno())
+        os.replace(tmp_file, data_file)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+    _cache_data(data_file, stat, data)
+
+
+def _page_etag():
+    """
+    ETag for a page rendered only from the current session's data, or None.
+    Pages showing flash messages aren't tagged, since a 304 would replay them.
+    """
+    if '_flashes' in session:
+        return None
+    try:
+        stat = os.stat(_get_data_file())
+    except OSError:
+        return None
+    key = f"{session['data_id']}:{stat.st_mtime_ns}:{stat.st_size}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def _tagged(response, etag):
+    """Attach an ETag so the browser revalidates instead of refetching."""
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+    return response
 
 
 @bp.route('/')
@@ -46,28 +226,41 @@ def index():
     return render_template('index.html')
 
 
+def _match_key(name, phone):
+    """Key used to match CSV rows to route manifest entries (name + phone)."""
+    return name.strip().lower(), phone.strip()
+
+
 def _parse_manifest(manifest_content):
-    """Parse the route manifest JSON and create a lookup for beneficiaries."""
+    """
+    Parse the route manifest JSON and create a lookup for beneficiaries.
+
+    Returns:
+        tuple: ({(name, phone): (route_number, sequence)}, error message or None)
+    """
     try:
-        manifest = json.loads(manifest_content)
+        manifest = orjson.loads(manifest_content)
         # Create a lookup by name+phone for matching
-        route_assignments = {}
-        for route in manifest.get('routes', []):
-            route_num = route['route_number']
-            for ben in route['beneficiaries']:
-                # Use name + phone as key for matching
-                key = (ben['name'].strip().lower(), ben['phone'].strip())
-                route_assignments[key] = {
-                    'route_number': route_num,
-                    'sequence': ben['sequence'],
-                    'name': ben['name'],
-                    'phone': ben['phone']
-                }
+        route_assignments = {
+            _match_key(ben['name'], ben['phone']): (route['route_number'], ben['sequence'])
+            for route in manifest.get('routes', [])
+            for ben in route['beneficiaries']
+        }
         return route_assignments, None
-    except (json.JSONDecodeError, KeyError) as e:
+    except (orjson.JSONDecodeError, KeyError) as e:
         return None, f"Error parsing manifest: {str(e)}"
 
 
+def _parse_upload(file, encoding):
+    """Parse an uploaded CSV straight from its stream, decoding as it goes."""
+    file.stream.seek(0)
+    text = io.TextIOWrapper(file.stream, encoding=encoding, newline='')
+    try:
+        return parse_csv(text)
+    finally:
+        text.detach()  # Leave the upload stream open
+
+
 @bp.route('/upload', methods=['POST'])
 def upload():
     """Handle CSV file upload."""
@@ -85,17 +278,14 @@ def upload():
         return redirect(url_for('main.index'))
 
     try:
-        content = file.read().decode('utf-8-sig')  # Handle BOM
+        result = _parse_upload(file, 'utf-8-sig')  # Handle BOM
     except UnicodeDecodeError:
         try:
-            file.seek(0)
-            content = file.read().decode('latin-1')
+            result = _parse_upload(file, 'latin-1')
         except Exception as e:
             flash(f'Error reading file: {str(e)}', 'error')
             return redirect(url_for('main.index'))
 
-    result = parse_csv(content)
-
     if result.has_errors:
         for error in result.errors:
             flash(error, 'error')
@@ -106,8 +296,8 @@ def upload():
     manifest_file = request.files.get('manifest')
     if manifest_file and manifest_file.filename:
         try:
-            manifest_content = manifest_file.read().decode('utf-8')
-            route_assignments, error = _parse_manifest(manifest_content)
+            # orjson decodes the UTF-8 bytes itself
+            route_assignments, error = _parse_manifest(manifest_file.stream.read())
             if error:
                 flash(f'Warning: {error}. Proceeding without route assignments.', 'warning')
                 route_assignments = None
@@ -116,10 +306,17 @@ def upload():
         except Exception as e:
             flash(f'Warning: Could not read manifest file: {str(e)}', 'warning')
 
+    # Try to match each row with a route assignment
+    no_route = (None, None)
+    if route_assignments:
+        assignments = [route_assignments.get(_match_key(b.name, b.phone), no_route)
+                       for b in result.beneficiaries]
+    else:
+        assignments = repeat(no_route)
+
     # Store in file
-    beneficiaries_data = []
-    for b in result.beneficiaries:
-        ben_data = {
+    beneficiaries_data = [
+        {
             'row_number': b.row_number,
             'name': b.name,
             'phone': b.phone,
@@ -132,19 +329,11 @@ def upload():
             'errors': b.errors,
             'warnings': b.warnings,
             'flagged': b.flagged,
-            'route_number': None,
-            'route_sequence': None
+            'route_number': route_number,
+            'route_sequence': route_sequence
         }
-
-        # Try to match with route assignment
-        if route_assignments:
-            key = (b.name.strip().lower(), b.phone.strip())
-            if key in route_assignments:
-                assignment = route_assignments[key]
-                ben_data['route_number'] = assignment['route_number']
-                ben_data['route_sequence'] = assignment['sequence']
-
-        beneficiaries_data.append(ben_data)
+        for b, (route_number, route_sequence) in zip(result.beneficiaries, assignments)
+    ]
 
     data = {
         'beneficiaries': beneficiaries_data,
@@ -160,23 +349,25 @@ def upload():
 @bp.route('/review')
 def review():
     """Review and flag data page."""
+    etag = _page_etag()
+    if etag and etag in request.if_none_match:
+        return _tagged(Response(status=304), etag)
+
     data = _load_data()
     if not data.get('beneficiaries'):
         flash('Please upload a CSV file first', 'error')
         return redirect(url_for('main.index'))
 
-    beneficiaries = []
-    for b in data['beneficiaries']:
-        formatted_phone, phone_valid = format_phone(b['phone'])
-        beneficiaries.append({
-            **b,
-            'formatted_phone': formatted_phone,
-            'phone_valid': phone_valid
-        })
+    phones = format_phones_bulk([b['phone'] for b in data['beneficiaries']])
+    beneficiaries = [
+        {**b, 'formatted_phone': formatted_phone, 'phone_valid': phone_valid}
+        for b, (formatted_phone, phone_valid) in zip(data['beneficiaries'], phones)
+    ]
 
-    return render_template('review.html',
-                           beneficiaries=beneficiaries,
-                           warnings=data.get('warnings', []))
+    response = make_response(render_template('review.html',
+                                             beneficiaries=beneficiaries,
+                                             warnings=data.get('warnings', [])))
+    return _tagged(response, etag)
 
 
 @bp.route('/update', methods=['POST'])
@@ -189,7 +380,7 @@ def update():
     beneficiaries = data['beneficiaries']
 
     # Update excluded status
-    excluded = request.form.getlist('exclude')
+    excluded = set(request.form.getlist('exclude'))
     for i, b in enumerate(beneficiaries):
         b['excluded'] = str(i) in excluded
 
@@ -231,30 +422,16 @@ def generate():
         # Fall back to sequential generation
         route_num = int(request.form.get('route_num', 1))
 
-        # Convert to Beneficiary objects for the old function
-        beneficiaries = []
-        for b in valid_beneficiaries:
-            beneficiary = Beneficiary(
-                row_number=b['row_number'],
-                name=b['name'],
-                phone=b['phone'],
-                address=b['address'],
-                household_size=b['household_size'],
-                items_needed=b['items_needed'],
-                special_items=b.get('special_items', ''),
-                contact_preference=b.get('contact_preference', ''),
-                notes=b.get('notes', ''),
-                errors=b['errors'],
-                warnings=b['warnings'],
-                flagged=b['flagged']
-            )
-            beneficiaries.append(beneficiary)
-
-        slips = generate_all_slips(beneficiaries, route_num)
+        slips = generate_all_slips(valid_beneficiaries, route_num)
         data['route_num'] = route_num
 
-    data['generated_slips'] = slips
+    # Slip text lives in its own files so the session data stays small. Each
+    # run gets a new directory and the saved data switches to it atomically;
+    # the previous run is kept for downloads that are still streaming it.
+    previous = data.get('slips_generation')
+    data['slips_generation'], data['generated_slips'] = _write_slips(session['data_id'], slips)
     _save_data(data)
+    _prune_slips(session['data_id'], keep=(data['slips_generation'], previous))
 
     return redirect(url_for('main.results'))
 
@@ -262,14 +439,30 @@ def generate():
 @bp.route('/results')
 def results():
     """Download page."""
+    etag = _page_etag()
+    if etag and etag in request.if_none_match:
+        return _tagged(Response(status=304), etag)
+
     data = _load_data()
     if not data.get('generated_slips'):
         return redirect(url_for('main.index'))
 
+    slips_dir = _generated_slips_dir(data)
+    if slips_dir is None:
+        return _slips_unavailable()
+
     slips = data['generated_slips']
-    return render_template('results.html',
-                           slips=slips,
-                           count=len(slips))
+    try:
+        with open(_slip_path(slips_dir, 0), encoding='utf-8', newline='') as f:
+            preview = f.read()
+    except OSError:
+        return _slips_unavailable()
+
+    response = make_response(render_template('results.html',
+                                             slips=slips,
+                                             preview=preview,
+                                             count=len(slips)))
+    return _tagged(response, etag)
 
 
 @bp.route('/download/<int:index>')
@@ -284,13 +477,50 @@ def download_single(index):
         flash('File not found', 'error')
         return redirect(url_for('main.results'))
 
-    filename, content = slips[index]
-    return send_file(
-        io.BytesIO(content.encode('utf-8')),
-        mimetype='text/plain',
-        as_attachment=True,
-        download_name=filename
-    )
+    slips_dir = _generated_slips_dir(data)
+    if slips_dir is None:
+        return _slips_unavailable()
+
+    filename, _ = slips[index]
+    try:
+        return send_file(
+            _slip_path(slips_dir, index),
+            mimetype='text/plain',
+            as_attachment=True,
+            download_name=filename
+        )
+    except OSError:
+        return _slips_unavailable()
+
+
+class _ZipBuffer(io.RawIOBase):
+    """Unseekable write target for ZipFile that hands back what has been written."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _stream_zip(files):
+    """Yield a ZIP archive of (filename, bytes) pairs while it is being written."""
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for filename, content in files:
+            zf.writestr(filename, content)
+            yield buffer.drain()
+    yield buffer.drain()
 
 
 @bp.route('/download/all')
@@ -300,22 +530,20 @@ def download_all():
     if not data.get('generated_slips'):
         return redirect(url_for('main.index'))
 
-    slips = data['generated_slips']
-
-    # Create ZIP file in memory
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for filename, content in slips:
-            zf.writestr(filename, content.encode('utf-8'))
-
-    zip_buffer.seek(0)
+    slips_dir = _generated_slips_dir(data)
+    if slips_dir is None:
+        return _slips_unavailable()
 
+    slips = data['generated_slips']
     route_num = data.get('route_num', 1)
-    return send_file(
-        zip_buffer,
+    filenames = [filename for filename, _ in slips]
+    paths = [_slip_path(slips_dir, i) for i in range(len(slips))]
+
+    # Stream the ZIP as each slip is read and compressed instead of building it in memory
+    return Response(
+        _stream_zip(zip(filenames, _read_slips(paths))),
         mimetype='application/zip',
-        as_attachment=True,
-        download_name=f'packing_slips_route_{route_num}.zip'
+        headers={'Content-Disposition': f'attachment; filename=packing_slips_route_{route_num}.zip'}
     )
 
 
@@ -326,7 +554,9 @@ def reset():
     data_id = session.get('data_id')
     if data_id:
         data_file = os.path.join(current_app.config['DATA_DIR'], f'{data_id}.json')
+        _evict_data(data_file)
         if os.path.exists(data_file):
             os.remove(data_file)
+        shutil.rmtree(_get_slips_dir(data_id), ignore_errors=True)
     session.clear()
     return redirect(url_for('main.index'))
@@ -1,49 +1,22 @@
+import io
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+
 from app.csv_parser import Beneficiary
 from app.phone_formatter import format_phone, extract_last_4_digits
 
 
-def generate_filename(route_num: int, sequence: int, name: str, phone: str) -> str:
-    """
-    Generate unique filename for packing slip.
-    Format: Route_{route_num}_{sequence:02d}_{initials}_{last4}.txt
-    """
-    # Extract initials from name
-    parts = name.strip().split()
-    initials = ''.join(p[0].upper() for p in parts if p)[:2]
-    if not initials:
-        initials = 'XX'
-
-    # Last 4 digits of phone
-    last4 = extract_last_4_digits(phone)
-
-    return f"Route_{route_num}_{sequence:02d}_{initials}_{last4}.txt"
-
-
-def generate_packing_slip(beneficiary: Beneficiary, route_num: int, sequence: int) -> str:
-    """
-    Generate bilingual packing slip text for a beneficiary.
-    """
-    formatted_phone, _ = format_phone(beneficiary.phone)
-    phone_display = formatted_phone if formatted_phone else 'N/A'
-
-    # Generate ID
-    parts = beneficiary.name.strip().split()
-    initials = ''.join(p[0].upper() for p in parts if p)[:2] or 'XX'
-    last4 = extract_last_4_digits(beneficiary.phone)
-    slip_id = f"Route_{route_num}_{sequence:02d}_{initials}_{last4}"
-
-    # Format special items section
-    special_section = ""
-    if beneficiary.special_items and beneficiary.special_items.strip():
-        special_section = f"""
+# Packing slip layout, filled in by _render_packing_slip
+_SPECIAL_ITEMS_TEMPLATE = """
 ****************************************************************
 *                 SPECIAL ITEMS / ARTICULOS ESPECIALES         *
 ****************************************************************
-* {beneficiary.special_items:<60} *
+* {:<60} *
 ****************************************************************
 """
-    else:
-        special_section = """
+
+_NO_SPECIAL_ITEMS = """
 ****************************************************************
 *                 SPECIAL ITEMS / ARTICULOS ESPECIALES         *
 ****************************************************************
@@ -51,29 +24,17 @@ def generate_packing_slip(beneficiary: Beneficiary, route_num: int, sequence: in
 ****************************************************************
 """
 
-    # Format items list
-    items_list = beneficiary.items_needed if beneficiary.items_needed else 'N/A'
-
-    # Format household size
-    household = beneficiary.household_size if beneficiary.household_size else 'N/A'
-
-    # Format contact preference
-    contact = beneficiary.contact_preference if beneficiary.contact_preference else 'N/A'
-
-    # Format notes
-    notes_section = ""
-    if beneficiary.notes and beneficiary.notes.strip():
-        notes_section = f"""
+_NOTES_TEMPLATE = """
 ----------------------------------------------------------------
 NOTAS / NOTES
 ----------------------------------------------------------------
-{beneficiary.notes}
+{}
 """
 
-    # Format address
-    address = beneficiary.address if beneficiary.address else 'N/A'
+# Written after each slip in a combined route file
+_PAGE_BREAK = "\n\n" + "-"*64 + "\n"
 
-    template = f"""================================================================
+_SLIP_TEMPLATE = """================================================================
                     DELIVERY / ENTREGA
 ================================================================
 ID: {slip_id}
@@ -82,7 +43,7 @@ ID: {slip_id}
 DIRECCION / ADDRESS:
 {address}
 
-TELEFONO / PHONE: {phone_display}
+TELEFONO / PHONE: {phone}
 
 ----------------------------------------------------------------
 HOGAR / HOUSEHOLD
@@ -92,7 +53,7 @@ Numero de personas / Number of people: {household}
 ----------------------------------------------------------------
 ARTICULOS NECESARIOS / ITEMS NEEDED
 ----------------------------------------------------------------
-{items_list}
+{items}
 {special_section}{notes_section}
 ----------------------------------------------------------------
 CONTACTO / CONTACT PREFERENCE
@@ -102,31 +63,118 @@ CONTACTO / CONTACT PREFERENCE
 ================================================================
 """
 
-    return template
+
+def _slip_id(route_num: int, sequence: int, name: str, phone: str) -> str:
+    """
+    Build the ID shared by a packing slip and its filename.
+    Format: Route_{route_num}_{sequence:02d}_{initials}_{last4}
+    """
+    # Extract initials from name
+    parts = name.strip().split()
+    initials = ''.join(p[0].upper() for p in parts if p)[:2] or 'XX'
+
+    # Last 4 digits of phone
+    last4 = extract_last_4_digits(phone)
+
+    return f"Route_{route_num}_{sequence:02d}_{initials}_{last4}"
+
+
+def generate_filename(route_num: int, sequence: int, name: str, phone: str) -> str:
+    """
+    Generate unique filename for packing slip.
+    Format: Route_{route_num}_{sequence:02d}_{initials}_{last4}.txt
+    """
+    return f"{_slip_id(route_num, sequence, name, phone)}.txt"
+
+
+def generate_packing_slip(beneficiary: Beneficiary, route_num: int, sequence: int, slip_id: str = None) -> str:
+    """
+    Generate bilingual packing slip text for a beneficiary.
+    Pass slip_id if it has already been built for the filename.
+    """
+    if slip_id is None:
+        slip_id = _slip_id(route_num, sequence, beneficiary.name, beneficiary.phone)
+    return _render_packing_slip(
+        slip_id, beneficiary.phone, beneficiary.address,
+        beneficiary.household_size, beneficiary.items_needed, beneficiary.special_items,
+        beneficiary.contact_preference, beneficiary.notes
+    )
+
+
+def _packing_slip_from_dict(data: dict, route_num: int, sequence: int, slip_id: str = None) -> str:
+    """Generate a packing slip from a stored beneficiary dict."""
+    if slip_id is None:
+        slip_id = _slip_id(route_num, sequence, data['name'], data['phone'])
+    return _render_packing_slip(
+        slip_id, data['phone'], data['address'],
+        data.get('household_size', ''), data.get('items_needed', ''), data.get('special_items', ''),
+        data.get('contact_preference', ''), data.get('notes', '')
+    )
+
+
+@lru_cache(maxsize=4096)
+def _render_packing_slip(slip_id: str, phone: str, address: str, household_size: str, items_needed: str,
+                         special_items: str, contact_preference: str, notes: str) -> str:
+    """
+    Render a packing slip from its fields.
+    Cached, so generating the same slips again reuses the text.
+    """
+    formatted_phone, _ = format_phone(phone)
+
+    if special_items and special_items.strip():
+        special_section = _SPECIAL_ITEMS_TEMPLATE.format(special_items)
+    else:
+        special_section = _NO_SPECIAL_ITEMS
+
+    return _SLIP_TEMPLATE.format_map({
+        'slip_id': slip_id,
+        'address': address or 'N/A',
+        'phone': formatted_phone or 'N/A',
+        'household': household_size or 'N/A',
+        'items': items_needed or 'N/A',
+        'special_section': special_section,
+        'notes_section': _NOTES_TEMPLATE.format(notes) if notes and notes.strip() else '',
+        'contact': contact_preference or 'N/A'
+    })
 
 
 def generate_all_slips(beneficiaries: list, route_num: int = 1) -> list:
     """
     Generate packing slips for all valid beneficiaries (sequential numbering).
 
+    Args:
+        beneficiaries: list of stored beneficiary dicts
+
     Returns:
         list of tuples: (filename, content)
     """
     results = []
     sequence = 1
 
-    for beneficiary in beneficiaries:
-        if not beneficiary.is_valid():
+    for b in beneficiaries:
+        if b['errors']:
             continue
 
-        filename = generate_filename(route_num, sequence, beneficiary.name, beneficiary.phone)
-        content = generate_packing_slip(beneficiary, route_num, sequence)
+        slip_id = _slip_id(route_num, sequence, b['name'], b['phone'])
+        filename = f"{slip_id}.txt"
+        content = _packing_slip_from_dict(b, route_num, sequence, slip_id)
         results.append((filename, content))
         sequence += 1
 
     return results
 
 
+def _route_file(header: list, slips) -> str:
+    """Write a route's header lines and its packing slips, with page breaks, into one file."""
+    buf = io.StringIO()
+    buf.write("\n".join(header))
+    for slip in slips:
+        buf.write("\n")
+        buf.write(slip)
+        buf.write(_PAGE_BREAK)
+    return buf.getvalue()
+
+
 def generate_all_slips_with_routes(beneficiaries_with_routes: list) -> list:
     """
     Generate packing slips using route assignments from routing app.
@@ -138,72 +186,48 @@ def generate_all_slips_with_routes(beneficiaries_with_routes: list) -> list:
     Returns:
         list of tuples: (filename, content) - one file per route
     """
-    # Group by route
-    by_route = {}
+    # Split off unassigned beneficiaries, then order the rest by route and stop
+    assigned = []
     unassigned = []
 
     for b in beneficiaries_with_routes:
         if b.get('route_number') is not None and b.get('route_sequence') is not None:
-            route_num = b['route_number']
-            if route_num not in by_route:
-                by_route[route_num] = []
-            by_route[route_num].append(b)
+            assigned.append(b)
         else:
             unassigned.append(b)
 
-    results = []
+    assigned.sort(key=itemgetter('route_number', 'route_sequence'))
 
-    # Helper class for beneficiary data
-    class BeneficiaryData:
-        def __init__(self, data):
-            self.name = data['name']
-            self.phone = data['phone']
-            self.address = data['address']
-            self.household_size = data.get('household_size', '')
-            self.items_needed = data.get('items_needed', '')
-            self.special_items = data.get('special_items', '')
-            self.contact_preference = data.get('contact_preference', '')
-            self.notes = data.get('notes', '')
+    results = []
 
     # Process assigned beneficiaries by route order - ONE FILE PER ROUTE
-    for route_num in sorted(by_route.keys()):
-        route_beneficiaries = sorted(by_route[route_num], key=lambda x: x['route_sequence'])
+    for route_num, group in groupby(assigned, key=itemgetter('route_number')):
+        route_beneficiaries = list(group)
 
         # Build combined content for this route
-        route_slips = []
-        route_slips.append(f"{'='*64}")
-        route_slips.append(f"                    ROUTE {route_num} - {len(route_beneficiaries)} STOPS")
-        route_slips.append(f"{'='*64}")
-        route_slips.append("")
-
-        for b in route_beneficiaries:
-            ben = BeneficiaryData(b)
-            sequence = b['route_sequence']
-            slip_content = generate_packing_slip(ben, route_num, sequence)
-            route_slips.append(slip_content)
-            route_slips.append("\n" + "-"*64 + "\n")  # Page break between slips
+        header = [
+            f"{'='*64}",
+            f"                    ROUTE {route_num} - {len(route_beneficiaries)} STOPS",
+            f"{'='*64}",
+            ""
+        ]
+        slips = (_packing_slip_from_dict(b, route_num, b['route_sequence']) for b in route_beneficiaries)
 
         filename = f"Route_{route_num:02d}_packing_slips.txt"
-        combined_content = "\n".join(route_slips)
-        results.append((filename, combined_content))
+        results.append((filename, _route_file(header, slips)))
 
     # Process unassigned beneficiaries (route 99)
     if unassigned:
-        route_slips = []
-        route_slips.append(f"{'='*64}")
-        route_slips.append(f"              ROUTE 99 - UNASSIGNED ({len(unassigned)} STOPS)")
-        route_slips.append(f"{'='*64}")
-        route_slips.append("NOTE: These addresses could not be matched to the route manifest.")
-        route_slips.append("")
-
-        for seq, b in enumerate(unassigned, start=1):
-            ben = BeneficiaryData(b)
-            slip_content = generate_packing_slip(ben, 99, seq)
-            route_slips.append(slip_content)
-            route_slips.append("\n" + "-"*64 + "\n")
+        header = [
+            f"{'='*64}",
+            f"              ROUTE 99 - UNASSIGNED ({len(unassigned)} STOPS)",
+            f"{'='*64}",
+            "NOTE: These addresses could not be matched to the route manifest.",
+            ""
+        ]
+        slips = (_packing_slip_from_dict(b, 99, seq) for seq, b in enumerate(unassigned, start=1))
 
         filename = "Route_99_unassigned_packing_slips.txt"
-        combined_content = "\n".join(route_slips)
-        results.append((filename, combined_content))
+        results.append((filename, _route_file(header, slips)))
 
     return results